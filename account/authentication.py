@@ -1,27 +1,38 @@
 from django.contrib.auth.models import User
+from django.contrib.auth.backends import ModelBackend
 
-from account.models import Profile
+from account.models import Profile, UserEmail
+from account.cache import get_cached_user
 
 
 class EmailAuthBackend:
     """ Аутентификация посредством адреса электронной почты """
     def authenticate(self, request, username=None, password=None):
         """ Метод получает пользователя с данным адресом электронной почты"""
-        try:
-            user = User.objects.get(email=username)
-            # Проверяем парольвстроенным методом check_password()
-            if user.check_password(password):
-                return user
+        # Ищем по индексированной копии адресов, см. account.models.UserEmail
+        user_ids = list(UserEmail.objects.filter(email=username)
+                                         .values_list('user_id', flat=True)[:2])
+        if len(user_ids) != 1:
             return None
-        except (User.DoesNotExist, User.MultipleObjectsReturned):
+        try:
+            user = User.objects.get(pk=user_ids[0])
+        except User.DoesNotExist:
             return None
+        # Проверяем парольвстроенным методом check_password()
+        if user.check_password(password):
+            return user
+        return None
         
     def get_user(self, user_id):
         """ Метод получает пользователя по его id """
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
+        return get_cached_user(user_id)
+
+
+class CachedModelBackend(ModelBackend):
+    """ Стандартная аутентификация, получающая пользователя из кеша """
+    def get_user(self, user_id):
+        user = get_cached_user(user_id)
+        return user if user and self.user_can_authenticate(user) else None
 
 
 def create_profile(backend, user, *args, **kwargs):
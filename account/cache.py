@@ -0,0 +1,51 @@
+import redis
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+
+from config.redis_client import breaker
+
+
+def user_cache_key(user_id):
+    """ Ключ кеша с пользователем и его профилем """
+    return f'auth:user:{user_id}'
+
+
+def get_cached_user(user_id):
+    """ Возвращает пользователя вместе с профилем. Пока пользователь
+        лежит в кеше, запросы к базе данных не выполняются.
+        Кеш сбрасывается сигналами, см. account.signals.
+        Пользователь нужен каждому запросу, поэтому при недоступном
+        Redis кеш обходится через размыкатель цепи, не дожидаясь таймаутов
+    """
+    key = user_cache_key(user_id)
+    user = None
+    use_cache = breaker.allow()
+    if use_cache:
+        try:
+            user = cache.get(key)
+        except redis.RedisError:
+            breaker.failure()
+            use_cache = False
+    if user is not None:
+        breaker.success()
+        return user
+    user = get_user_model().objects.select_related('profile') \
+                                   .filter(pk=user_id).first()
+    if user is not None and use_cache:
+        try:
+            cache.set(key, user, settings.AUTH_USER_CACHE_TTL)
+        except redis.RedisError:
+            breaker.failure()
+        else:
+            breaker.success()
+    return user
+
+
+def invalidate_user(user_id):
+    """ Удаляет пользователя из кеша """
+    try:
+        cache.delete(user_cache_key(user_id))
+    except redis.RedisError:
+        pass
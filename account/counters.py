@@ -0,0 +1,47 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import Contact, UserCounters
+
+
+def count_all(user_id):
+    """ Подсчитывает значения счетчиков пользователя по базе данных """
+    from images.models import Image
+
+    likes = Image.users_like.through.objects
+    return {
+        'followers': Contact.objects.filter(user_to_id=user_id).count(),
+        'following': Contact.objects.filter(user_from_id=user_id).count(),
+        'images': Image.objects.filter(user_id=user_id).count(),
+        'likes_received': likes.filter(image__user_id=user_id).count(),
+    }
+
+
+def rebuild_counters(user_id):
+    """ Пересчитывает и сохраняет счетчики пользователя """
+    counters, _ = UserCounters.objects.update_or_create(user_id=user_id,
+                                                        defaults=count_all(user_id))
+    return counters
+
+
+def get_counters(user):
+    """ Возвращает счетчики пользователя, создавая их при первом обращении """
+    try:
+        return user.counters
+    except UserCounters.DoesNotExist:
+        return rebuild_counters(user.id)
+
+
+def update_counters(user_id, **deltas):
+    """ Атомарно изменяет счетчики пользователя на заданные величины.
+        Вызывается в той же транзакции, что и само изменение
+    """
+    values = {field: Greatest(F(field) + delta, 0)
+              for field, delta in deltas.items() if delta}
+    if not values:
+        return
+    updated = UserCounters.objects.filter(user_id=user_id).update(**values)
+    if not updated:
+        # Счетчиков еще нет: подсчитываем их заново, изменение
+        # к этому моменту уже есть в базе данных
+        rebuild_counters(user_id)
@@ -0,0 +1,16 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from account.search import index_user
+
+
+class Command(BaseCommand):
+    """ Заново строит поисковые слова всех пользователей """
+    help = 'Rebuild the people directory search index'
+
+    def handle(self, *args, **options):
+        total = 0
+        for user in User.objects.iterator():
+            index_user(user)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} users'))
@@ -0,0 +1,66 @@
+from django.db.models import Count
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from account.models import Contact, UserCounters
+from images.models import Image
+
+
+FIELDS = ('followers', 'following', 'images', 'likes_received')
+
+
+def grouped_counts(queryset, field, user_ids):
+    """ Подсчитывает строки queryset по пользователям одним запросом """
+    return dict(queryset.filter(**{f'{field}__in': user_ids})
+                        .values(field)
+                        .annotate(total=Count('pk'))
+                        .values_list(field, 'total'))
+
+
+class Command(BaseCommand):
+    """ Пересчитывает денормализованные счетчики пользователей """
+    help = 'Recompute drifted per-user social counters in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of users checked per query')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        likes = Image.users_like.through.objects
+        last_id = 0
+        checked = fixed = 0
+        while True:
+            user_ids = list(User.objects.filter(id__gt=last_id)
+                                        .order_by('id')
+                                        .values_list('id', flat=True)[:chunk_size])
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            actual = {
+                'followers': grouped_counts(Contact.objects, 'user_to', user_ids),
+                'following': grouped_counts(Contact.objects, 'user_from', user_ids),
+                'images': grouped_counts(Image.objects, 'user', user_ids),
+                'likes_received': grouped_counts(likes, 'image__user', user_ids),
+            }
+            existing = UserCounters.objects.in_bulk(user_ids)
+            drifted = []
+            missing = []
+            for user_id in user_ids:
+                values = {field: actual[field].get(user_id, 0) for field in FIELDS}
+                counters = existing.get(user_id)
+                if counters is None:
+                    missing.append(UserCounters(user_id=user_id, **values))
+                elif any(getattr(counters, field) != value
+                         for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(counters, field, value)
+                    drifted.append(counters)
+            if drifted:
+                UserCounters.objects.bulk_update(drifted, FIELDS)
+            if missing:
+                UserCounters.objects.bulk_create(missing, ignore_conflicts=True)
+            checked += len(user_ids)
+            fixed += len(drifted) + len(missing)
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} users, fixed {fixed} counters'))
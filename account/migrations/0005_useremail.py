@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 18:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_emails(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    UserEmail = apps.get_model('account', 'UserEmail')
+    emails = (UserEmail(user_id=user_id, email=email)
+              for user_id, email in User.objects.exclude(email='')
+                                                .values_list('id', 'email')
+                                                .iterator())
+    UserEmail.objects.bulk_create(emails, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_usersearchterm'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserEmail',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='email_lookup', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('email', models.EmailField(db_index=True, max_length=254)),
+            ],
+        ),
+        migrations.RunPython(fill_emails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def fill_search_terms(apps, schema_editor):
+    # Поисковые слова строятся так же, как в account.search.user_terms.
+    # Историческая модель не имеет get_full_name()
+    User = apps.get_model('auth', 'User')
+    UserSearchTerm = apps.get_model('account', 'UserSearchTerm')
+    indexed = UserSearchTerm.objects.values('user_id')
+    users = User.objects.exclude(id__in=indexed) \
+                        .values_list('id', 'username', 'first_name', 'last_name')
+    terms = (UserSearchTerm(user_id=user_id, term=term)
+             for user_id, username, first_name, last_name in users.iterator()
+             for term in {word.lower()[:150]
+                          for word in [username] + first_name.split() + last_name.split()
+                          if word})
+    UserSearchTerm.objects.bulk_create(terms, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_useremail'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_search_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def grouped_counts(queryset, field, user_ids):
+    return dict(queryset.filter(**{f'{field}__in': user_ids})
+                        .values(field)
+                        .annotate(total=Count('pk'))
+                        .values_list(field, 'total'))
+
+
+def fill_counters(apps, schema_editor):
+    # Счетчики создаются вместе с пользователем, см. account.signals.
+    # Пользователям, у которых их еще нет, подсчитываем их так же,
+    # как команда reconcile_user_counters
+    User = apps.get_model('auth', 'User')
+    Contact = apps.get_model('account', 'Contact')
+    UserCounters = apps.get_model('account', 'UserCounters')
+    Image = apps.get_model('images', 'Image')
+    likes = Image._meta.get_field('users_like').remote_field.through.objects
+    user_ids = list(User.objects.exclude(id__in=UserCounters.objects.values('user_id'))
+                                .values_list('id', flat=True))
+    chunk_size = 1000
+    for i in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[i:i + chunk_size]
+        counts = {
+            'followers': grouped_counts(Contact.objects, 'user_to', chunk),
+            'following': grouped_counts(Contact.objects, 'user_from', chunk),
+            'images': grouped_counts(Image.objects, 'user', chunk),
+            'likes_received': grouped_counts(likes, 'image__user', chunk),
+        }
+        UserCounters.objects.bulk_create(
+            [UserCounters(user_id=user_id,
+                          **{field: values.get(user_id, 0)
+                             for field, values in counts.items()})
+             for user_id in chunk],
+            ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0006_fill_user_search_terms'),
+        ('images', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
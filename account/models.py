@@ -26,13 +26,63 @@ class Contact(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['-created']),
+            models.Index(fields=['user_from', 'user_to']),
         ]
         ordering = ['-created']
 
     def __str__(self):
         return f'{self.user_from} follows {self.user_to}' 
+
+
+class UserCounters(models.Model):
+    """ Денормализованные счетчики пользователя. Обновляются вместе
+        с изменениями, которые они учитывают, см. account.counters
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                related_name='counters',
+                                primary_key=True,
+                                on_delete=models.CASCADE)
+    followers = models.PositiveIntegerField(default=0)
+    following = models.PositiveIntegerField(default=0)
+    images = models.PositiveIntegerField(default=0)
+    likes_received = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'Counters of {self.user_id}'
     
 
+class UserSearchTerm(models.Model):
+    """ Слова из имени пользователя для поиска по префиксу.
+        Поддерживается сигналами, см. account.search
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             related_name='search_terms',
+                             on_delete=models.CASCADE)
+    term = models.CharField(max_length=150)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'user']),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+class UserEmail(models.Model):
+    """ Индексированная копия адреса электронной почты пользователя
+        для входа по нему. Поддерживается сигналами, см. account.signals
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                related_name='email_lookup',
+                                primary_key=True,
+                                on_delete=models.CASCADE)
+    email = models.EmailField(db_index=True)
+
+    def __str__(self):
+        return self.email
+
+
 user_model = get_user_model()
 user_model.add_to_class('following',
                         models.ManyToManyField('self',
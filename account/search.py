@@ -0,0 +1,31 @@
+from django.db import transaction
+
+from .models import UserSearchTerm
+
+
+def user_terms(user):
+    """ Возвращает слова, по началу которых можно найти пользователя """
+    words = [user.username] + user.get_full_name().split()
+    return {word.lower()[:150] for word in words if word}
+
+
+@transaction.atomic
+def index_user(user):
+    """ Обновляет поисковые слова пользователя """
+    UserSearchTerm.objects.filter(user=user).delete()
+    UserSearchTerm.objects.bulk_create(
+        [UserSearchTerm(user=user, term=term) for term in user_terms(user)])
+
+
+def search_users(users, query):
+    """ Отбирает пользователей, у которых каждое слово запроса
+        является началом одного из поисковых слов
+    """
+    for word in query.lower().split():
+        # Сравнение по диапазону использует индекс по term,
+        # в отличие от LIKE 'word%'
+        user_ids = UserSearchTerm.objects.filter(term__gte=word,
+                                                 term__lt=word + '\uffff') \
+                                         .values('user_id')
+        users = users.filter(id__in=user_ids)
+    return users
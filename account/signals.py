@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Profile, UserCounters, UserEmail
+from .cache import invalidate_user
+from .search import index_user
+
+
+def invalidate_on_commit(user_id):
+    """ Сбрасывает пользователя в кеше после фиксации транзакции, чтобы
+        параллельный запрос не закешировал его прежнее состояние
+    """
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    """ Обновляет поисковые слова и адрес электронной почты пользователя.
+        Новому пользователю создает нулевые счетчики, чтобы первый
+        запрос к ним не подсчитывал их по базе данных
+    """
+    invalidate_on_commit(instance.id)
+    if created:
+        UserCounters.objects.create(user=instance)
+    if not update_fields or 'email' in update_fields:
+        if instance.email:
+            UserEmail.objects.update_or_create(user=instance,
+                                               defaults={'email': instance.email})
+        else:
+            UserEmail.objects.filter(user=instance).delete()
+    if update_fields and not {'username', 'first_name',
+                              'last_name'} & set(update_fields):
+        # Например, при входе обновляется только last_login
+        return
+    index_user(instance)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_on_commit(instance.id)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    """ Сбрасывает закешированного пользователя вместе с профилем """
+    invalidate_on_commit(instance.user_id)
@@ -1,3 +1,100 @@
+from unittest import mock
+
+import redis
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from .cache import get_cached_user
+from .counters import count_all, get_counters
+from .models import UserCounters
+from config.redis_client import get_redis, breaker
+from images.models import Image
+
+
+class CountersTests(TestCase):
+    """ Счетчики пользователя совпадают с подсчетом по базе данных """
+
+    def setUp(self):
+        cache.clear()
+        get_redis().flushall()
+        breaker.success()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        self.client.force_login(self.alice)
+
+    def assertCountersConsistent(self, *users):
+        for user in users:
+            counters = UserCounters.objects.get(user=user)
+            self.assertEqual({field: getattr(counters, field)
+                              for field in count_all(user.id)},
+                             count_all(user.id))
+
+    def follow(self, user, action='follow'):
+        response = self.client.post(reverse('user_follow'),
+                                    {'id': user.id, 'action': action})
+        self.assertEqual(response.json(), {'status': 'ok'})
+
+    def test_follow_and_unfollow(self):
+        get_counters(self.alice)
+        get_counters(self.bob)
+        self.follow(self.bob)
+        # Повторная подписка не меняет счетчики
+        self.follow(self.bob)
+        self.assertEqual(UserCounters.objects.get(user=self.bob).followers, 1)
+        self.assertCountersConsistent(self.alice, self.bob)
+        self.follow(self.bob, 'unfollow')
+        self.assertEqual(UserCounters.objects.get(user=self.bob).followers, 0)
+        self.assertCountersConsistent(self.alice, self.bob)
+
+    def test_likes_received(self):
+        get_counters(self.bob)
+        image = Image.objects.create(user=self.bob, title='Sunset',
+                                     url='http://example.com/sunset.jpg')
+        image.users_like.add(self.alice)
+        self.assertEqual(UserCounters.objects.get(user=self.bob).likes_received, 1)
+        self.alice.images_liked.clear()
+        self.assertEqual(UserCounters.objects.get(user=self.bob).likes_received, 0)
+        image.refresh_from_db()
+        self.assertEqual(image.total_likes, 0)
+
+    def test_new_users_get_counters(self):
+        counters = UserCounters.objects.get(user=self.alice)
+        self.assertEqual(counters.followers + counters.following, 0)
+
+    def test_counters_are_created_on_first_use(self):
+        """ Счетчики, которых еще нет, подсчитываются по базе данных """
+        UserCounters.objects.all().delete()
+        Image.objects.create(user=self.alice, title='Sunset',
+                             url='http://example.com/sunset.jpg')
+        self.follow(self.bob)
+        self.assertCountersConsistent(self.alice, self.bob)
+        self.assertEqual(get_counters(User.objects.get(id=self.alice.id)).images, 1)
+
+
+class CachedUserTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        breaker.success()
+        self.addCleanup(breaker.success)
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pass')
+
+    def test_user_is_cached(self):
+        self.assertEqual(get_cached_user(self.user.id), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_user(self.user.id), self.user)
 
-# Create your tests here.
+    def test_redis_errors_open_the_breaker(self):
+        """ После нескольких ошибок Redis пользователь читается
+            из базы данных без обращений к кешу
+        """
+        with mock.patch('account.cache.cache') as broken_cache:
+            broken_cache.get.side_effect = redis.TimeoutError
+            for _ in range(settings.REDIS_BREAKER_FAILURES + 2):
+                self.assertEqual(get_cached_user(self.user.id), self.user)
+        self.assertEqual(broken_cache.get.call_count,
+                         settings.REDIS_BREAKER_FAILURES)
+        self.assertTrue(breaker.is_open)
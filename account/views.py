@@ -5,11 +5,21 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.views.decorators.http import require_POST
+from django.conf import settings
+from django.db import transaction
 
 from .forms import LoginForm, UserRegistrationForm, UserEditForm, ProfileEditForm
 from .models import Profile, Contact
+from .counters import get_counters, update_counters
+from .search import search_users
 from actions.utils import create_action
 from actions.models import Action
+from actions.timeline import get_timeline, get_actions, refresh_timeline
+from actions.feed import hydrate_actions
+from images.models import Image
+from images.pagination import keyset_page, normalize_cursor
+from images.cache import cached_list_page
+from config.profiling import query_budget
 
 
 '''
@@ -72,6 +82,7 @@ def user_logout(request):
 # предстасвление; если нет, то перенаправляет пользователя на 
 # изначально запрошенный url. С этой целью добавлен скрытый
 # элемент input с именем next
+@query_budget(10)
 @login_required
 def dashboard(request):
     """ Представление Dashboard """
@@ -79,11 +90,18 @@ def dashboard(request):
     actions = Action.objects.exclude(user=request.user)
     following_ids = request.user.following.values_list('id', flat=True)
     if following_ids:
-        # Если пользователь подписан на других,
-        # то извлечь только их действия
-        actions = actions.filter(user_id__in=following_ids)
-    actions = actions.select_related('user', 'user__profile')[:10].prefetch_related('target')[:10]
-    context = {'section': 'dashboard', 'actions': actions}
+        # Если пользователь подписан на других, то берем
+        # заранее построенную ленту их действий из Redis
+        action_ids = get_timeline(request.user, settings.ACTIONS_DASHBOARD_SIZE)
+        actions = get_actions(action_ids)
+    else:
+        actions = actions.select_related('user', 'user__profile')
+        actions = hydrate_actions(actions[:settings.ACTIONS_DASHBOARD_SIZE])
+    context = {
+        'section': 'dashboard',
+        'actions': actions,
+        'counters': get_counters(request.user),
+    }
     template = 'account/dashboard.html'
     return render(request=request, template_name=template, context=context)
 
@@ -142,18 +160,69 @@ def edit(request):
 
 @login_required
 def user_list(request):
-    users = User.objects.filter(is_active=True)
-    context = {'section': 'people', 'users': users}
+    users = User.objects.filter(is_active=True).select_related('profile')
+    query = request.GET.get('q', '').strip()
+    if query:
+        # Поиск по началу имени пользователя, имени или фамилии
+        users = search_users(users, query)
+    users = keyset_page(users,
+                        cursor=request.GET.get('cursor'),
+                        per_page=settings.USER_LIST_PAGE_SIZE,
+                        ordering=('id',))
+    if request.GET.get('users_only'):
+        if not users:
+            # Если AJAX-запрос и пользователей больше нет,
+            # то вернуть пустую страницу
+            return HttpResponse('')
+        context = {'users': users}
+        template = 'account/user/list_users.html'
+        response = render(request=request, template_name=template, context=context)
+        if users.has_next():
+            # Курсор следующей страницы для бесконечной прокрутки
+            response['X-Next-Cursor'] = users.next_cursor
+        return response
+    context = {'section': 'people', 'users': users, 'query': query}
     template = 'account/user/list.html'
     return render(request=request, template_name=template, context=context)
 
 
+@query_budget(8)
 @login_required
 def user_detail(request, username):
     user = get_object_or_404(User,
                              username=username,
                              is_active=True)
-    context = {'section': 'people', 'user': user}
+    ordering = ('-created', '-id')
+    cursor = normalize_cursor(Image, request.GET.get('cursor'), ordering)
+    # Галерея пользователя выводится постранично по ключу (created, id)
+    images_html, next_cursor = cached_list_page(
+        page_key=f'user:{user.id}:{cursor}',
+        get_page=lambda: keyset_page(user.images_created.filter(status=Image.Status.READY),
+                                     cursor=cursor,
+                                     per_page=settings.IMAGE_LIST_PAGE_SIZE,
+                                     ordering=ordering))
+    if request.GET.get('images_only'):
+        if not images_html.strip():
+            # Если AJAX-запрос и изображений больше нет,
+            # то вернуть пустую страницу
+            return HttpResponse('')
+        response = HttpResponse(images_html)
+        if next_cursor:
+            # Курсор следующей страницы для бесконечной прокрутки
+            response['X-Next-Cursor'] = next_cursor
+        return response
+    # Подписка проверяется одним запросом по индексу
+    # вместо загрузки всех подписчиков
+    is_following = Contact.objects.filter(user_from=request.user,
+                                          user_to=user).exists()
+    context = {
+        'section': 'people',
+        'user': user,
+        'counters': get_counters(user),
+        'is_following': is_following,
+        'images_html': images_html,
+        'next_cursor': next_cursor,
+    }
     template = 'account/user/detail.html'
     return render(request=request, template_name=template, context=context)
 
@@ -166,13 +235,24 @@ def user_follow(request):
     if user_id and action:
         try:
             user = User.objects.get(id=user_id)
+            # Подписка и счетчики обоих пользователей
+            # изменяются в одной транзакции
+            with transaction.atomic():
+                if action == 'follow':
+                    _, created = Contact.objects.get_or_create(user_from=request.user,
+                                                               user_to=user)
+                    changed = 1 if created else 0
+                else:
+                    deleted, _ = Contact.objects.filter(user_from=request.user,
+                                                        user_to=user).delete()
+                    changed = -deleted
+                update_counters(request.user.id, following=changed)
+                update_counters(user.id, followers=changed)
             if action == 'follow':
-                Contact.objects.get_or_create(user_from=request.user,
-                                              user_to=user)
                 create_action(request.user, 'is following', user)
-            else:
-                Contact.objects.filter(user_from=request.user,
-                                       user_to=user).delete()
+            # Набор отслеживаемых пользователей изменился,
+            # поэтому перестраиваем ленту действий
+            refresh_timeline(request.user)
             return JsonResponse({'status': 'ok'})
         except User.DoesNotExist:
             return JsonResponse({'status': 'error'})
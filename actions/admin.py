@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Action
+from .feed import hydrate_actions
 
 
 @admin.register(Action)
@@ -8,3 +9,10 @@ class ActionAdmin(admin.ModelAdmin):
     list_display = ('user', 'verb', 'target', 'created')
     list_filter = ('created',)
     search_fields = ('verb',)
+    list_select_related = ('user',)
+
+    def get_changelist_instance(self, request):
+        """ Загружает цели действий текущей страницы пакетно """
+        changelist = super().get_changelist_instance(request)
+        changelist.result_list = hydrate_actions(changelist.result_list)
+        return changelist
@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+
+from .models import Action
+
+
+# Связанные объекты, которые нужно подтянуть вместе с целью действия
+# каждого типа. Ключ - метка модели в виде app_label.model_name
+TARGET_SELECT_RELATED = {
+    'auth.user': ('profile',),
+    'images.image': ('user',),
+}
+
+
+def hydrate_actions(actions):
+    """ Загружает цели действий пакетно: по одному запросу на каждый тип цели.
+        Возвращает список действий с уже заполненным полем target
+    """
+    actions = list(actions)
+    # Группируем идентификаторы целей по типу содержимого
+    target_ids = defaultdict(set)
+    for action in actions:
+        if action.target_ct_id and action.target_id:
+            target_ids[action.target_ct_id].add(action.target_id)
+
+    targets = {}
+    for ct_id, ids in target_ids.items():
+        # get_for_id использует кеш ContentType и не обращается к базе данных
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+        if model is None:
+            continue
+        queryset = model._default_manager.filter(pk__in=ids)
+        related = TARGET_SELECT_RELATED.get(model._meta.label_lower)
+        if related:
+            queryset = queryset.select_related(*related)
+        for obj in queryset:
+            targets[(ct_id, obj.pk)] = obj
+
+    for action in actions:
+        # Кешируем цель в экземпляре действия, поэтому обращения
+        # к action.target в шаблонах не порождают новых запросов.
+        # Для удаленных целей кешируется None
+        target = targets.get((action.target_ct_id, action.target_id))
+        Action.target.set_cached_value(action, target)
+    return actions
@@ -0,0 +1,66 @@
+import time
+from pathlib import Path
+
+from django.utils import timezone
+from django.core.management.base import BaseCommand, CommandError
+
+from actions.models import Action
+from actions.retention import (expired_condition, prune_batch,
+                               open_archive, table_sizes)
+
+
+class Command(BaseCommand):
+    """ Удаляет или архивирует действия, срок хранения которых истек """
+    help = 'Delete or archive expired actions in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of actions deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Pause between batches, in seconds')
+        parser.add_argument('--archive-dir',
+                            help='Export deleted actions to gzipped NDJSON '
+                                 'files in this directory')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count expired actions')
+
+    def handle(self, *args, **options):
+        condition = expired_condition()
+        if condition is None:
+            self.stdout.write('Retention is not configured')
+            return
+        if options['dry_run']:
+            total = Action.objects.filter(condition).count()
+            self.stdout.write(f'{total} expired actions')
+            return
+        self.report('Before', table_sizes())
+        archive = None
+        if options['archive_dir']:
+            directory = Path(options['archive_dir'])
+            if not directory.is_dir():
+                raise CommandError(f'{directory} is not a directory')
+            path = directory / f'actions-{timezone.now():%Y%m%d%H%M%S}.ndjson.gz'
+            archive = open_archive(path)
+        total = 0
+        try:
+            while True:
+                deleted = prune_batch(condition, options['batch_size'], archive)
+                if not deleted:
+                    break
+                total += deleted
+                # Даем другим процессам записать свои изменения
+                time.sleep(options['sleep'])
+        finally:
+            if archive is not None:
+                archive.close()
+        if archive is not None:
+            self.stdout.write(f'Archived to {path}')
+        self.report('After', table_sizes())
+        self.stdout.write(self.style.SUCCESS(f'Deleted {total} actions'))
+
+    def report(self, title, sizes):
+        if not sizes:
+            return
+        self.stdout.write(f'{title}:')
+        for name, size in sorted(sizes.items()):
+            self.stdout.write(f'  {name}: {size / 1024:.1f} KiB')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+
+from actions.timeline import rebuild_timeline
+
+
+class Command(BaseCommand):
+    """ Перестраивает ленты действий пользователей в Redis """
+    help = 'Rebuild users activity timelines stored in Redis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*',
+                            help='Rebuild only timelines of the given users')
+
+    def handle(self, *args, **options):
+        # По-умолчанию перестраиваем ленты всех пользователей,
+        # у которых есть подписки
+        users = User.objects.filter(following__isnull=False).distinct()
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+        total = 0
+        for user in users.iterator():
+            action_ids = rebuild_timeline(user)
+            total += 1
+            self.stdout.write(f'{user.username}: {len(action_ids)} actions')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} timelines'))
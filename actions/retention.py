@@ -0,0 +1,97 @@
+import gzip
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Action
+
+
+def expired_condition(now=None):
+    """ Условие отбора действий, срок хранения которых истек.
+        Сроки задаются настройками ACTIONS_RETENTION_DAYS (по глаголам)
+        и ACTIONS_RETENTION_DEFAULT_DAYS (для остальных глаголов).
+        Срок None означает бессрочное хранение. Если ни один срок
+        не задан, возвращает None
+    """
+    now = now or timezone.now()
+    condition = Q()
+    retention = settings.ACTIONS_RETENTION_DAYS
+    for verb, days in retention.items():
+        if days is not None:
+            condition |= Q(verb=verb, created__lt=now - timedelta(days=days))
+    days = settings.ACTIONS_RETENTION_DEFAULT_DAYS
+    if days is not None:
+        condition |= Q(created__lt=now - timedelta(days=days)) \
+                     & ~Q(verb__in=list(retention))
+    return condition or None
+
+
+def serialize_action(action):
+    """ Представляет действие в виде словаря для архива """
+    return {
+        'id': action['id'],
+        'user_id': action['user_id'],
+        'verb': action['verb'],
+        'created': action['created'].isoformat(),
+        'target_ct': action['target_ct_id'],
+        'target_id': action['target_id'],
+    }
+
+
+def prune_batch(condition, batch_size, archive=None):
+    """ Удаляет одну пачку устаревших действий в короткой транзакции.
+        archive - открытый файл, в который пачка записывается
+        построчно в формате JSON перед удалением.
+        Возвращает число удаленных действий
+    """
+    with transaction.atomic():
+        rows = list(Action.objects.filter(condition)
+                                  .order_by('id')
+                                  .values('id', 'user_id', 'verb', 'created',
+                                          'target_ct_id', 'target_id')
+                                  [:batch_size])
+        if not rows:
+            return 0
+        if archive is not None:
+            for row in rows:
+                archive.write(json.dumps(serialize_action(row)) + '\n')
+        # У действий нет зависимых объектов, поэтому Django удаляет
+        # пачку одним запросом DELETE по первичному ключу
+        Action.objects.filter(id__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def open_archive(path):
+    """ Открывает сжатый файл архива для дозаписи """
+    return gzip.open(path, 'at', encoding='utf-8')
+
+
+def table_sizes():
+    """ Размер таблицы действий и ее индексов в байтах.
+        Для SQLite используется виртуальная таблица dbstat, а если SQLite
+        собран без нее, то размер всего файла базы данных.
+        Для остальных баз данных возвращает пустой словарь
+    """
+    if connection.vendor != 'sqlite':
+        return {}
+    table = Action._meta.db_table
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+        names = [table] + [name for name, info in constraints.items()
+                           if info['index']]
+        try:
+            placeholders = ', '.join(['%s'] * len(names))
+            cursor.execute(f'SELECT name, SUM(pgsize) FROM dbstat '
+                           f'WHERE name IN ({placeholders}) GROUP BY name',
+                           names)
+            return dict(cursor.fetchall())
+        except DatabaseError:
+            cursor.execute('PRAGMA page_count')
+            page_count = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_size')
+            page_size = cursor.fetchone()[0]
+            return {'database': page_count * page_size}
@@ -0,0 +1,25 @@
+import logging
+
+from django.core.signals import request_started, request_finished
+from django.dispatch import receiver
+
+from . import utils
+
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(request_started)
+def request_started_handler(sender, **kwargs):
+    """ Действия запроса записываются одним пакетом по его окончании """
+    utils.request_started()
+
+
+@receiver(request_finished)
+def request_finished_handler(sender, **kwargs):
+    """ Записывает действия, накопленные за время запроса """
+    try:
+        utils.request_finished()
+    except Exception:
+        # Ответ уже отправлен, ошибку можно только записать в журнал
+        logger.exception('Failed to flush buffered actions')
@@ -1,3 +1,244 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import redis
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.core.signals import request_started, request_finished
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Action
+from .retention import expired_condition, prune_batch
+from .timeline import fan_out, get_timeline, timeline_key
+from .utils import create_action, dedup_key, flush_actions
+from account.models import Contact, Profile
+from config.redis_client import get_redis, breaker
+
+
+def broken_redis():
+    """ Клиент Redis, все обращения к которому завершаются ошибкой """
+    client = mock.Mock()
+    client.lrange.side_effect = redis.ConnectionError
+    client.set.side_effect = redis.ConnectionError
+    client.pipeline.return_value.execute.side_effect = redis.ConnectionError
+    return client
+
+
+class RedisTestCase(TestCase):
+    """ Каждый тест начинается с пустых Redis и кеша
+        и замкнутого размыкателя цепи
+    """
+
+    def setUp(self):
+        get_redis().flushall()
+        cache.clear()
+        breaker.success()
+        self.addCleanup(breaker.success)
+
+
+class TimelineTests(RedisTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        Profile.objects.create(user=self.alice)
+        Contact.objects.create(user_from=self.alice, user_to=self.bob)
+
+    def test_empty_timeline_is_not_rebuilt(self):
+        """ Пустая лента хранится в Redis и не строится заново """
+        self.assertEqual(get_timeline(self.alice, 10), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_timeline(self.alice, 10), [])
+
+    def test_fan_out_to_cold_timeline(self):
+        """ Новое действие не создает ленту, которой нет в Redis,
+            и лента затем строится целиком из базы данных
+        """
+        old_ids = [Action.objects.create(user=self.bob, verb=f'action {i}').id
+                   for i in range(5)]
+        action = Action.objects.create(user=self.bob, verb='bookmarked image')
+        fan_out(action)
+        self.assertFalse(get_redis().exists(timeline_key(self.alice.id)))
+        self.assertEqual(get_timeline(self.alice, 10),
+                         [action.id] + old_ids[::-1])
+
+    def test_fan_out_to_existing_timeline(self):
+        self.assertEqual(get_timeline(self.alice, 10), [])
+        action = Action.objects.create(user=self.bob, verb='bookmarked image')
+        fan_out(action)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_timeline(self.alice, 10), [action.id])
+
+    def test_timeline_falls_back_to_database(self):
+        """ Без Redis лента выбирается из базы данных """
+        action = Action.objects.create(user=self.bob, verb='bookmarked image')
+        with mock.patch('actions.timeline.get_redis', broken_redis):
+            self.assertEqual(get_timeline(self.alice, 10), [action.id])
+
+    def test_dashboard_without_redis(self):
+        Action.objects.create(user=self.bob, verb='bookmarked image')
+        self.client.force_login(self.alice)
+        with mock.patch('actions.timeline.get_redis', broken_redis):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'bookmarked image')
+
+    def test_follow_without_redis(self):
+        """ Подписка сохраняется, даже если ленту не удалось перестроить """
+        carol = User.objects.create_user('carol', 'carol@example.com', 'pass')
+        self.client.force_login(self.alice)
+        with mock.patch('actions.timeline.get_redis', broken_redis):
+            response = self.client.post(reverse('user_follow'),
+                                        {'id': carol.id, 'action': 'follow'})
+        self.assertEqual(response.json(), {'status': 'ok'})
+        self.assertTrue(Contact.objects.filter(user_from=self.alice,
+                                               user_to=carol).exists())
+        self.assertFalse(get_redis().exists(timeline_key(self.alice.id)))
+
+
+class CreateActionTests(RedisTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        self.addCleanup(flush_actions)
+
+    def test_duplicate_actions_are_skipped(self):
+        self.assertTrue(create_action(self.alice, 'is following', self.bob))
+        self.assertFalse(create_action(self.alice, 'is following', self.bob))
+        self.assertTrue(create_action(self.alice, 'has created an account'))
+        # Вне запроса действия записываются сразу
+        self.assertEqual(Action.objects.count(), 2)
+        key = dedup_key(self.alice, 'is following', self.bob)
+        self.assertGreater(get_redis().ttl(key), settings.ACTIONS_DEDUP_PENDING_SECONDS)
+
+    def test_actions_are_buffered_until_request_end(self):
+        request_started.send(sender=self.__class__)
+        self.assertTrue(create_action(self.alice, 'is following', self.bob))
+        self.assertTrue(create_action(self.alice, 'has created an account'))
+        self.assertEqual(Action.objects.count(), 0)
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(Action.objects.count(), 2)
+
+    def test_failed_write_allows_retry(self):
+        """ Если действие не записано, его повтор не отбрасывается """
+        with mock.patch('actions.utils.Action.objects.bulk_create',
+                        side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                create_action(self.alice, 'is following', self.bob)
+        self.assertFalse(get_redis().exists(dedup_key(self.alice, 'is following',
+                                                      self.bob)))
+        self.assertTrue(create_action(self.alice, 'is following', self.bob))
+        self.assertEqual(Action.objects.count(), 1)
+
+    def test_actions_without_redis(self):
+        """ Без Redis повторы действий отсекаются по базе данных """
+        with mock.patch('actions.utils.get_redis', broken_redis):
+            self.assertTrue(create_action(self.alice, 'is following', self.bob))
+            self.assertFalse(create_action(self.alice, 'is following', self.bob))
+        self.assertEqual(Action.objects.count(), 1)
+
+    def test_open_breaker_skips_redis(self):
+        """ После нескольких ошибок Redis действия записываются
+            через базу данных без обращений к Redis
+        """
+        client = broken_redis()
+        with mock.patch('actions.utils.get_redis', return_value=client):
+            for i in range(settings.REDIS_BREAKER_FAILURES + 2):
+                self.assertTrue(create_action(self.alice, f'action {i}'))
+        self.assertEqual(client.set.call_count, settings.REDIS_BREAKER_FAILURES)
+        self.assertTrue(breaker.is_open)
+        self.assertEqual(Action.objects.count(), settings.REDIS_BREAKER_FAILURES + 2)
+
+
+@override_settings(ACTIONS_RETENTION_DAYS={'likes': 30, 'is following': None},
+                   ACTIONS_RETENTION_DEFAULT_DAYS=90)
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+
+    def action(self, verb, days):
+        """ Создает действие, выполненное days дней назад """
+        action = Action.objects.create(user=self.alice, verb=verb)
+        Action.objects.filter(id=action.id).update(
+            created=timezone.now() - timedelta(days=days))
+        return action.id
+
+    def expired_ids(self):
+        return set(Action.objects.filter(expired_condition())
+                                 .values_list('id', flat=True))
+
+    def test_retention_per_verb(self):
+        # Свой срок глагола действует вместо срока по умолчанию
+        expired = {self.action('likes', 31), self.action('likes', 60),
+                   self.action('bookmarked image', 91)}
+        self.action('likes', 29)
+        self.action('bookmarked image', 60)
+        self.assertEqual(self.expired_ids(), expired)
+
+    def test_none_keeps_forever(self):
+        self.action('is following', 1000)
+        self.assertEqual(self.expired_ids(), set())
+
+    @override_settings(ACTIONS_RETENTION_DAYS={}, ACTIONS_RETENTION_DEFAULT_DAYS=None)
+    def test_retention_not_configured(self):
+        self.assertIsNone(expired_condition())
+        out = StringIO()
+        call_command('prune_actions', stdout=out)
+        self.assertIn('Retention is not configured', out.getvalue())
+
+    def test_prune_in_batches(self):
+        expired = [self.action('likes', 31) for _ in range(5)]
+        kept = self.action('likes', 1)
+        condition = expired_condition()
+        with self.assertNumQueries(4):
+            # Точка сохранения, выборка пачки, удаление одним запросом
+            # и освобождение точки сохранения
+            self.assertEqual(prune_batch(condition, 2), 2)
+        self.assertFalse(Action.objects.filter(id__in=expired[:2]).exists())
+        self.assertEqual(prune_batch(condition, 2), 2)
+        self.assertEqual(prune_batch(condition, 2), 1)
+        self.assertEqual(prune_batch(condition, 2), 0)
+        self.assertEqual(list(Action.objects.values_list('id', flat=True)), [kept])
+
+    def test_dry_run(self):
+        self.action('likes', 31)
+        self.action('likes', 1)
+        out = StringIO()
+        call_command('prune_actions', '--dry-run', stdout=out)
+        self.assertIn('1 expired actions', out.getvalue())
+        self.assertEqual(Action.objects.count(), 2)
+
+    def test_prune_with_archive(self):
+        expired = [self.action('likes', 31), self.action('bookmarked image', 91)]
+        kept = self.action('likes', 1)
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('prune_actions', '--batch-size=1', '--sleep=0',
+                         f'--archive-dir={directory}', stdout=out)
+            paths = list(Path(directory).glob('actions-*.ndjson.gz'))
+            self.assertEqual(len(paths), 1)
+            with gzip.open(paths[0], 'rt', encoding='utf-8') as archive:
+                rows = [json.loads(line) for line in archive]
+        self.assertIn('Deleted 2 actions', out.getvalue())
+        self.assertEqual([row['id'] for row in rows], expired)
+        self.assertEqual(rows[0]['verb'], 'likes')
+        self.assertEqual(rows[0]['user_id'], self.alice.id)
+        self.assertEqual(list(Action.objects.values_list('id', flat=True)), [kept])
+
+    def test_archive_dir_must_exist(self):
+        with self.assertRaises(CommandError):
+            call_command('prune_actions', '--archive-dir=/nonexistent/archive')
@@ -0,0 +1,100 @@
+import logging
+import redis
+
+from django.conf import settings
+
+from .models import Action
+from .feed import hydrate_actions
+from config.redis_client import get_redis, execute_batched, breaker
+
+
+logger = logging.getLogger(__name__)
+
+# Маркер пустой ленты. Без него ленты пользователей, на которых
+# еще никто не подписан с действиями, строились бы заново при каждом
+# обращении. Идентификаторы действий начинаются с 1, поэтому 0 свободен
+EMPTY_TIMELINE = 0
+
+
+def timeline_key(user_id):
+    """ Ключ Redis, под которым хранится лента действий пользователя """
+    return f'user:{user_id}:timeline'
+
+
+def fan_out(action):
+    """ Добавляет действие в ленты всех подписчиков его автора """
+    follower_ids = action.user.followers.values_list('id', flat=True)
+
+    def push(pipe, follower_id):
+        key = timeline_key(follower_id)
+        # Добавляем только в уже построенные ленты. Ленты, которой нет
+        # (например, после перезапуска Redis), из одного нового действия
+        # не создаем: ее целиком построит get_timeline() из базы данных
+        pipe.lpushx(key, action.id)
+        # Обрезаем ленту, чтобы она не росла бесконечно
+        pipe.ltrim(key, 0, settings.ACTIONS_TIMELINE_SIZE - 1)
+
+    # Команды отправляются в Redis пакетами, а не по одной
+    execute_batched(follower_ids.iterator(), push)
+
+
+def following_action_ids(user, count):
+    """ Возвращает идентификаторы последних действий тех,
+        на кого подписан пользователь, по базе данных
+    """
+    following_ids = user.following.values_list('id', flat=True)
+    return list(Action.objects.filter(user_id__in=following_ids)
+                              .values_list('id', flat=True)[:count])
+
+
+def rebuild_timeline(user):
+    """ Заново строит ленту пользователя по действиям тех, на кого он подписан """
+    action_ids = following_action_ids(user, settings.ACTIONS_TIMELINE_SIZE)
+    key = timeline_key(user.id)
+    pipe = get_redis().pipeline()
+    pipe.delete(key)
+    pipe.rpush(key, *(action_ids or [EMPTY_TIMELINE]))
+    pipe.execute()
+    return action_ids
+
+
+def refresh_timeline(user):
+    """ Перестраивает ленту пользователя, если Redis доступен. Изменение,
+        из-за которого лента перестраивается, уже сохранено, поэтому
+        ошибка Redis только записывается в журнал
+    """
+    try:
+        rebuild_timeline(user)
+    except redis.RedisError as e:
+        logger.warning('Failed to rebuild timeline of user %s: %s', user.id, e)
+
+
+def get_timeline(user, count):
+    """ Возвращает идентификаторы последних действий из ленты пользователя.
+        Если Redis недоступен, то действия выбираются из базы данных
+    """
+    if not breaker.allow():
+        return following_action_ids(user, count)
+    try:
+        action_ids = get_redis().lrange(timeline_key(user.id), 0, count - 1)
+        if not action_ids:
+            # Ленты еще нет в Redis (например, после его перезапуска),
+            # поэтому восстанавливаем ее из базы данных
+            action_ids = rebuild_timeline(user)
+    except redis.RedisError as e:
+        breaker.failure()
+        logger.warning('Timeline of user %s is unavailable: %s', user.id, e)
+        return following_action_ids(user, count)
+    breaker.success()
+    return [int(action_id) for action_id in action_ids
+            if int(action_id) != EMPTY_TIMELINE][:count]
+
+
+def get_actions(action_ids):
+    """ Извлекает действия одним запросом, сохраняя порядок ленты """
+    actions = Action.objects.filter(id__in=action_ids) \
+                            .select_related('user', 'user__profile')
+    actions_by_id = {action.id: action for action in hydrate_actions(actions)}
+    # Действия, удаленные из базы данных, в ленте пропускаем
+    return [actions_by_id[action_id] for action_id in action_ids
+            if action_id in actions_by_id]
@@ -1,14 +1,74 @@
+import hashlib
+import logging
 import datetime
+import threading
+import redis
+from contextvars import ContextVar
+
+from django.conf import settings
 from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 
 from .models import Action
+from .timeline import fan_out
+from config.redis_client import get_redis, execute_batched, breaker
+
+
+logger = logging.getLogger(__name__)
+
+# Действия, ожидающие пакетной записи в базу данных,
+# вместе с их ключами защиты от повторов
+_buffer = []
+_buffer_lock = threading.Lock()
+# Обрабатывается ли запрос. Действия копятся только до конца запроса,
+# вне запросов (в командах, фоновых потоках) они записываются сразу
+_in_request = ContextVar('actions_in_request', default=False)
+
+
+def dedup_key(user, verb, target=None):
+    """ Ключ Redis, защищающий от повторной записи одинакового действия """
+    target_ct_id = target_id = ''
+    if target:
+        target_ct_id = ContentType.objects.get_for_model(target).id
+        target_id = target.id
+    verb_hash = hashlib.sha1(verb.encode()).hexdigest()[:16]
+    return f'action:dedup:{user.id}:{target_ct_id}:{target_id}:{verb_hash}'
+
 
 def create_action(user, verb, target=None):
     # Проверяем, небыло ли каких-либо аналогичных действий,
-    # совершонных за последнюю минуту
+    # совершонных за последнюю минуту. Ключ создается только если
+    # его еще нет, за одну команду Redis. Пока действие не записано,
+    # ключ живет недолго: если запись не состоится, повтор не будет
+    # отброшен. После записи срок ключа продлевается, см. flush_actions()
+    if not breaker.allow():
+        # Redis недоступен, проверяем и записываем действие через базу данных
+        return create_action_sync(user, verb, target)
+    key = dedup_key(user, verb, target)
+    try:
+        is_new = get_redis().set(key, 1, nx=True,
+                                 ex=settings.ACTIONS_DEDUP_PENDING_SECONDS)
+    except redis.RedisError:
+        breaker.failure()
+        return create_action_sync(user, verb, target)
+    breaker.success()
+    if not is_new:
+        return False
+    # В запросе действие будет записано в базу данных вместе
+    # с другими по окончании запроса
+    action = Action(user=user, verb=verb, target=target)
+    with _buffer_lock:
+        _buffer.append((action, key))
+        full = len(_buffer) >= settings.ACTIONS_BUFFER_SIZE
+    if full or not _in_request.get():
+        flush_actions()
+    return True
+
+
+def create_action_sync(user, verb, target=None):
+    """ Проверяет и записывает действие сразу, используя только базу данных """
     now = timezone.now()
-    last_minute = now - datetime.timedelta(seconds=60)
+    last_minute = now - datetime.timedelta(seconds=settings.ACTIONS_DEDUP_SECONDS)
     similar_actions = Action.objects.filter(user_id=user.id,
                                             verb=verb,
                                             created__gte=last_minute)
@@ -20,5 +80,62 @@ def create_action(user, verb, target=None):
         # никаких существующих действий не найдено
         action = Action(user=user, verb=verb, target=target)
         action.save()
+        fan_out_safely([action])
         return True
     return False
+
+
+def request_started():
+    """ Начинает накапливать действия до конца запроса """
+    _in_request.set(True)
+
+
+def request_finished():
+    """ Записывает действия, накопленные за время запроса """
+    _in_request.set(False)
+    flush_actions()
+
+
+def flush_actions():
+    """ Записывает накопленные действия в базу данных одним запросом
+        и раздает их по лентам подписчиков
+    """
+    global _buffer
+    with _buffer_lock:
+        pending, _buffer = _buffer, []
+    if not pending:
+        return 0
+    actions = [action for action, _ in pending]
+    keys = [key for _, key in pending]
+    try:
+        Action.objects.bulk_create(actions)
+    except Exception:
+        # Действия не записаны: снимаем защиту от повторов,
+        # чтобы их можно было записать снова
+        update_dedup_keys(keys, lambda pipe, key: pipe.delete(key))
+        raise
+    update_dedup_keys(keys, lambda pipe, key: pipe.expire(
+        key, settings.ACTIONS_DEDUP_SECONDS))
+    fan_out_safely(actions)
+    return len(actions)
+
+
+def update_dedup_keys(keys, add_command):
+    """ Выполняет команду над ключами защиты от повторов. Без Redis
+        ключи просто истекут через ACTIONS_DEDUP_PENDING_SECONDS
+    """
+    try:
+        execute_batched(keys, add_command)
+    except redis.RedisError:
+        logger.warning('Could not update %d action dedup keys', len(keys))
+
+
+def fan_out_safely(actions):
+    """ Раздает действия по лентам подписчиков. Если Redis недоступен,
+        ленты будут восстановлены из базы данных при следующем чтении
+    """
+    try:
+        for action in actions:
+            fan_out(action)
+    except redis.RedisError:
+        logger.warning('Could not fan out %d actions to timelines', len(actions))
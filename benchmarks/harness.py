@@ -0,0 +1,121 @@
+import time
+import statistics
+import fakeredis
+
+from django.db import connection
+from django.db.models import Count
+from django.urls import reverse
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+
+from images.models import Image
+from config.redis_client import InstrumentedRedisMixin
+from .seed import USERNAME_PREFIX
+
+
+class CountingRedis(InstrumentedRedisMixin, fakeredis.FakeRedis):
+    """ Имитация Redis, считающая обращения к нему.
+        Конвейер считается одним обращением
+    """
+    calls = 0
+
+    def execute_command(self, *args, **options):
+        self.calls += 1
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        def counted_execute(*args, **kwargs):
+            self.calls += 1
+            return execute(*args, **kwargs)
+
+        pipe.execute = counted_execute
+        return pipe
+
+
+def percentile(values, fraction):
+    """ Перцентиль по методу ближайшего ранга """
+    values = sorted(values)
+    index = min(len(values) - 1, round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+def scenarios():
+    """ Возвращает сценарии замеров: имя -> (клиент, функция запроса).
+        Функция получает номер запроса и возвращает ответ
+    """
+    users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+    # Самый активный читатель ленты и самый популярный автор
+    viewer = users.annotate(total=Count('following')).order_by('-total').first()
+    author = users.annotate(total=Count('followers')).order_by('-total').first()
+    popular = list(Image.objects.filter(user__in=users)
+                                .order_by('-total_views')[:20])
+    client = Client()
+    client.force_login(viewer)
+
+    def like(i):
+        # Лайк и его отмена по очереди, чтобы данные не менялись
+        image = popular[i // 2 % len(popular)]
+        return client.post(reverse('images:like'),
+                           {'id': image.id,
+                            'action': 'like' if i % 2 == 0 else 'unlike'})
+
+    return {
+        'dashboard': lambda i: client.get(reverse('dashboard')),
+        'image_list': lambda i: client.get(reverse('images:list')),
+        'image_deteil': lambda i: client.get(
+            popular[i % len(popular)].get_absolute_url()),
+        'image_ranking': lambda i: client.get(reverse('images:ranking')),
+        'user_detail': lambda i: client.get(author.get_absolute_url()),
+        'image_like': like,
+    }
+
+
+def measure(request, redis_client, repeat, warmup):
+    """ Выполняет запросы сценария и возвращает задержки (p50 и p99,
+        в миллисекундах), среднее число SQL-запросов и обращений к Redis
+    """
+    for i in range(warmup):
+        request(i)
+    timings = []
+    queries = []
+    redis_calls = []
+    for i in range(warmup, warmup + repeat):
+        redis_client.calls = 0
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = request(i)
+            timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f'Unexpected status {response.status_code}')
+        queries.append(len(captured.captured_queries))
+        redis_calls.append(redis_client.calls)
+    return {
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'queries': round(statistics.mean(queries), 2),
+        'redis_calls': round(statistics.mean(redis_calls), 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """ Сравнивает результаты с сохраненными. Число запросов к базе
+        данных и к Redis не должно расти, задержки могут расти не более
+        чем в (1 + tolerance) раз. Возвращает список регрессий
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for key in ('queries', 'redis_calls'):
+            if result[key] > expected[key]:
+                regressions.append(f'{name}: {key} {result[key]} > {expected[key]}')
+        for key in ('p50_ms', 'p99_ms'):
+            limit = expected[key] * (1 + tolerance)
+            if result[key] > limit:
+                regressions.append(f'{name}: {key} {result[key]} > {limit:.2f}')
+    return regressions
@@ -0,0 +1,99 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.seed import seed
+from benchmarks.harness import CountingRedis, scenarios, measure, compare
+from config.redis_client import set_redis, breaker
+from images.counters import seed_views
+
+
+# Файл с результатами, принятыми за эталон
+BASELINE_FILE = Path(__file__).resolve().parents[2] / 'baselines.json'
+
+
+class Command(BaseCommand):
+    """ Замеряет производительность основных представлений на тестовой
+        базе данных с созданным набором данных и имитацией Redis
+    """
+    help = 'Benchmark hot views and fail on regressions against stored baselines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--images-per-user', type=int, default=5)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Measured requests per view')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Unmeasured requests per view')
+        parser.add_argument('--only', nargs='*',
+                            help='Benchmark only the given views')
+        parser.add_argument('--baseline', default=str(BASELINE_FILE),
+                            help='Baseline JSON file')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed relative latency growth')
+
+    def handle(self, *args, **options):
+        dataset = {'users': options['users'],
+                   'images_per_user': options['images_per_user']}
+        redis_client = CountingRedis()
+        previous = set_redis(redis_client)
+        breaker.success()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+                MEDIA_ROOT=media_root,
+                # Без отладочных инструментов, как в рабочем окружении
+                DEBUG=False,
+                # Превышение бюджета SQL-запросов представления - ошибка
+                PROFILING_ENFORCE_BUDGETS=True,
+                CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0,
+                                                          autoclobber=True,
+                                                          serialize=False)
+            try:
+                self.stdout.write('Seeding test database...')
+                seed(**dataset)
+                seed_views()
+                results = {}
+                for name, request in scenarios().items():
+                    if options['only'] and name not in options['only']:
+                        continue
+                    results[name] = measure(request, redis_client,
+                                            options['requests'],
+                                            options['warmup'])
+                    self.report(name, results[name])
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+                set_redis(previous)
+
+        path = Path(options['baseline'])
+        if options['save_baseline']:
+            path.write_text(json.dumps({'dataset': dataset, 'results': results},
+                                       indent=4) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {path}'))
+            return
+        if not path.exists():
+            self.stdout.write('No baseline to compare with, '
+                              'run with --save-baseline first')
+            return
+        baseline = json.loads(path.read_text())
+        if baseline['dataset'] != dataset:
+            raise CommandError(f'Baseline was recorded for {baseline["dataset"]}')
+        regressions = compare(results, baseline['results'], options['tolerance'])
+        if regressions:
+            raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions'))
+
+    def report(self, name, result):
+        self.stdout.write(f'{name:<15} p50 {result["p50_ms"]:>8.2f} ms  '
+                          f'p99 {result["p99_ms"]:>8.2f} ms  '
+                          f'{result["queries"]:>6.2f} queries  '
+                          f'{result["redis_calls"]:>6.2f} redis calls')
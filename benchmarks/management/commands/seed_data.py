@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from benchmarks.seed import seed, clear
+from config.redis_client import is_available
+from images.counters import seed_views
+
+
+class Command(BaseCommand):
+    """ Создает набор данных для нагрузочного тестирования """
+    help = 'Generate users, images, likes, follows and actions with a power-law distribution'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--images-per-user', type=int, default=5)
+        parser.add_argument('--likes-per-user', type=int, default=20)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Exponent of the power-law distribution')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed')
+        parser.add_argument('--no-thumbnails', action='store_true',
+                            help='Do not pre-generate thumbnails')
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete previously generated data first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.stdout.write(f'Deleted {clear()} objects')
+        if not options['users']:
+            return
+        created = seed(users=options['users'],
+                       images_per_user=options['images_per_user'],
+                       likes_per_user=options['likes_per_user'],
+                       follows_per_user=options['follows_per_user'],
+                       alpha=options['alpha'],
+                       random_seed=options['seed'],
+                       thumbnails=not options['no_thumbnails'])
+        if is_available():
+            # Просмотры и рейтинг изображений хранятся в Redis
+            seed_views()
+        summary = ', '.join(f'{total} {name}' for name, total in created.items())
+        self.stdout.write(self.style.SUCCESS(f'Created {summary}'))
@@ -0,0 +1,143 @@
+import io
+import random
+
+from PIL import Image as PILImage
+from django.db import transaction
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+
+from account.models import Profile, Contact, UserEmail
+from actions.models import Action
+from images.models import Image
+from images.thumbnails import generate_thumbnails
+
+
+# Префикс имен пользователей, созданных генератором
+USERNAME_PREFIX = 'bench_'
+# Пароль всех созданных пользователей
+PASSWORD = 'bench'
+
+
+def zipf_weights(size, alpha):
+    """ Веса степенного распределения: элемент с рангом k
+        встречается в k ** alpha раз реже первого
+    """
+    return [1 / (rank + 1) ** alpha for rank in range(size)]
+
+
+def sample(rng, population, weights, count):
+    """ Выбирает до count различных элементов с учетом весов """
+    chosen = set(rng.choices(population, weights, k=count))
+    return list(chosen)
+
+
+def image_file(rng, index):
+    """ Создает небольшой настоящий файл JPEG """
+    color = tuple(rng.randrange(256) for _ in range(3))
+    picture = PILImage.new('RGB', (320, 240), color)
+    buffer = io.BytesIO()
+    picture.save(buffer, 'JPEG', quality=70)
+    return default_storage.save(f'images/bench/{index}.jpg',
+                                ContentFile(buffer.getvalue()))
+
+
+def clear():
+    """ Удаляет данные, созданные генератором ранее """
+    users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+    for name in Image.objects.filter(user__in=users) \
+                             .values_list('image', flat=True):
+        if name:
+            default_storage.delete(name)
+    return users.delete()[0]
+
+
+def seed(users=200, images_per_user=5, likes_per_user=20,
+         follows_per_user=10, alpha=1.1, random_seed=0, thumbnails=True):
+    """ Создает набор данных со степенным распределением: немногие
+        пользователи публикуют большую часть изображений и собирают
+        большую часть подписчиков, немногие изображения собирают
+        большую часть лайков и просмотров.
+        Возвращает словарь с числом созданных объектов
+    """
+    rng = random.Random(random_seed)
+    password = make_password(PASSWORD)
+    with transaction.atomic():
+        start = User.objects.count()
+        new_users = User.objects.bulk_create(
+            User(username=f'{USERNAME_PREFIX}{start + i}',
+                 first_name=f'Bench{start + i}',
+                 email=f'{USERNAME_PREFIX}{start + i}@example.com',
+                 password=password)
+            for i in range(users))
+        # bulk_create не вызывает сигналы, поэтому связанные
+        # данные пользователей создаем сами
+        Profile.objects.bulk_create(Profile(user=user) for user in new_users)
+        UserEmail.objects.bulk_create(UserEmail(user=user, email=user.email)
+                                      for user in new_users)
+        user_weights = zipf_weights(users, alpha)
+
+        owners = rng.choices(new_users, user_weights, k=users * images_per_user)
+        images = Image.objects.bulk_create(
+            Image(user=owner,
+                  title=f'Bench image {index}',
+                  slug=f'bench-image-{index}',
+                  url=f'https://example.com/bench/{index}.jpg',
+                  image=image_file(rng, index),
+                  status=Image.Status.READY)
+            for index, owner in enumerate(owners))
+        image_weights = zipf_weights(len(images), alpha)
+        for image, weight in zip(images, image_weights):
+            image.total_views = int(weight * 10000)
+        Image.objects.bulk_update(images, ['total_views'], batch_size=500)
+
+        contacts = []
+        for user in new_users:
+            count = rng.randint(0, follows_per_user * 2)
+            for target in sample(rng, new_users, user_weights, count):
+                if target != user:
+                    contacts.append(Contact(user_from=user, user_to=target))
+        Contact.objects.bulk_create(contacts, batch_size=500)
+
+        through = Image.users_like.through
+        likes = []
+        for user in new_users:
+            count = rng.randint(0, likes_per_user * 2)
+            for image in sample(rng, images, image_weights, count):
+                likes.append(through(image_id=image.id, user_id=user.id))
+        through.objects.bulk_create(likes, batch_size=500)
+
+        user_ct = ContentType.objects.get_for_model(User)
+        image_ct = ContentType.objects.get_for_model(Image)
+        actions = [Action(user=user, verb='has created an account')
+                   for user in new_users]
+        actions += [Action(user=image.user, verb='bookmarked image',
+                           target_ct=image_ct, target_id=image.id)
+                    for image in images]
+        actions += [Action(user=contact.user_from, verb='is following',
+                           target_ct=user_ct, target_id=contact.user_to_id)
+                    for contact in contacts]
+        actions += [Action(user_id=like.user_id, verb='likes',
+                           target_ct=image_ct, target_id=like.image_id)
+                    for like in likes]
+        # Действия в случайном порядке, как если бы они совершались вперемешку
+        rng.shuffle(actions)
+        Action.objects.bulk_create(actions, batch_size=500)
+
+    # Денормализованные данные пересчитываем штатными командами
+    for command in ('reconcile_likes', 'reconcile_user_counters',
+                    'rebuild_user_search', 'rebuild_image_search'):
+        call_command(command, stdout=io.StringIO())
+    if thumbnails:
+        for image in images:
+            generate_thumbnails(image.image)
+    return {
+        'users': len(new_users),
+        'images': len(images),
+        'follows': len(contacts),
+        'likes': len(likes),
+        'actions': len(actions),
+    }
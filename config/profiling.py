@@ -0,0 +1,180 @@
+import json
+import time
+import logging
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+
+logger = logging.getLogger(__name__)
+
+# Замеры текущего запроса. Вне запросов замеры не ведутся
+_current = ContextVar('request_profile', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """ Представление выполнило больше SQL-запросов, чем объявлено """
+
+
+class RequestProfile:
+    """ Замеры одного запроса: время в миллисекундах и число обращений """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_start = None
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.sql = []
+        self.redis_calls = 0
+        self.redis_ms = 0.0
+        self.template_ms = 0.0
+        self.template_depth = 0
+        self.query_budget = None
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.sql_ms += duration
+        if len(self.sql) < settings.PROFILING_MAX_SQL:
+            self.sql.append((duration, sql))
+
+
+def query_budget(limit):
+    """ Объявляет наибольшее число SQL-запросов представления.
+        При PROFILING_ENFORCE_BUDGETS = True превышение вызывает
+        исключение QueryBudgetExceeded, иначе записывается в журнал
+    """
+    def decorator(view):
+        # Декораторы, применяемые поверх, копируют атрибут через wraps()
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def record_redis(duration):
+    """ Учитывает обращение к Redis, см. config.redis_client """
+    profile = _current.get()
+    if profile is not None:
+        profile.redis_calls += 1
+        profile.redis_ms += duration * 1000
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile = _current.get()
+        if profile is not None:
+            profile.add_query(sql, (time.perf_counter() - start) * 1000)
+
+
+class ProfilingTemplate:
+    """ Шаблон, учитывающий время своей отрисовки """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None:
+            return self.template.render(context, request)
+        # Вложенные отрисовки (например, render_to_string в шаблонных
+        # тегах) уже входят во время внешней
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_ms += (time.perf_counter() - start) * 1000
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+    """ Шаблонизатор Django, учитывающий время отрисовки шаблонов """
+
+    def from_string(self, template_code):
+        return ProfilingTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return ProfilingTemplate(super().get_template(template_name))
+
+
+class ProfilingMiddleware:
+    """ Замеряет время и число обращений к базе данных и Redis, время
+        отрисовки шаблонов и представления. Отдает замеры в заголовке
+        Server-Timing и записывает их в журнал. Для медленных запросов
+        в журнал попадают и их SQL-запросы
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_sql_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - profile.start) * 1000
+        view_ms = 0.0
+        if profile.view_start is not None:
+            view_ms = (time.perf_counter() - profile.view_start) * 1000
+        if settings.PROFILING_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={profile.sql_ms:.1f};desc="{profile.queries} queries"',
+                f'redis;dur={profile.redis_ms:.1f};desc="{profile.redis_calls} calls"',
+                f'tpl;dur={profile.template_ms:.1f}',
+                f'view;dur={view_ms:.1f}',
+                f'total;dur={total_ms:.1f}',
+            ])
+        data = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'view_ms': round(view_ms, 1),
+            'template_ms': round(profile.template_ms, 1),
+            'sql_ms': round(profile.sql_ms, 1),
+            'queries': profile.queries,
+            'redis_ms': round(profile.redis_ms, 1),
+            'redis_calls': profile.redis_calls,
+        }
+        if total_ms >= settings.PROFILING_SLOW_REQUEST_MS:
+            # Самые долгие SQL-запросы медленного запроса
+            slowest = sorted(profile.sql, reverse=True)[:settings.PROFILING_SLOW_SQL]
+            data['sql'] = [{'ms': round(duration, 2), 'sql': sql}
+                           for duration, sql in slowest]
+            logger.warning(json.dumps(data))
+        else:
+            logger.info(json.dumps(data))
+        self.check_budget(request, profile)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _current.get()
+        if profile is not None:
+            profile.view_start = time.perf_counter()
+            profile.query_budget = getattr(view_func, 'query_budget', None)
+
+    def check_budget(self, request, profile):
+        budget = profile.query_budget
+        if budget is None or profile.queries <= budget:
+            return
+        message = (f'{request.path} made {profile.queries} SQL queries, '
+                   f'the budget is {budget}')
+        if settings.PROFILING_ENFORCE_BUDGETS:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
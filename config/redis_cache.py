@@ -0,0 +1,25 @@
+from django.core.cache.backends.redis import RedisCache, RedisCacheClient
+
+from .redis_client import get_redis
+
+
+class SharedRedisCacheClient(RedisCacheClient):
+    """ Клиент кеша, работающий через общий клиент Redis проекта,
+        см. config.redis_client. Собственный пул соединений
+        не создается, поэтому кеш и остальные части проекта делят
+        одно ограничение REDIS_POOL_OPTIONS['max_connections']
+    """
+
+    def get_client(self, key=None, *, write=False):
+        return get_redis()
+
+
+class SharedRedisCache(RedisCache):
+    """ Кеш Django в Redis на общем пуле соединений. Адрес сервера
+        и параметры пула берутся из настроек REDIS_*, поэтому LOCATION
+        не нужен. Из OPTIONS используется только serializer
+    """
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self._class = SharedRedisCacheClient
@@ -0,0 +1,169 @@
+import time
+import threading
+import redis
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .profiling import record_redis
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """ Размыкатель цепи. После failure_threshold ошибок подряд
+        размыкается, и обращения к Redis не выполняются reset_timeout
+        секунд. Затем пропускает одно пробное обращение: при успехе
+        цепь замыкается, при ошибке снова размыкается
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """ Можно ли сейчас обращаться к Redis """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Пробное обращение. Остальные запросы ждут его результата
+            # еще reset_timeout секунд
+            self.opened_at = time.monotonic()
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+# Общий для процесса размыкатель цепи для обращений к Redis
+# на горячих путях, см. images.counters
+breaker = CircuitBreaker(settings.REDIS_BREAKER_FAILURES,
+                         settings.REDIS_BREAKER_RESET_SECONDS)
+
+
+class InstrumentedRedisMixin:
+    """ Учитывает обращения к Redis в замерах запроса, см. config.profiling.
+        Конвейер считается одним обращением
+    """
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            record_redis(time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        def timed_execute(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return execute(*args, **kwargs)
+            finally:
+                record_redis(time.perf_counter() - start)
+
+        pipe.execute = timed_execute
+        return pipe
+
+
+class InstrumentedRedis(InstrumentedRedisMixin, redis.Redis):
+    pass
+
+
+def create_client():
+    """ Создает клиент Redis с пулом соединений по настройкам проекта """
+    if settings.REDIS_BACKEND == 'fake':
+        try:
+            import fakeredis
+        except ImportError:
+            raise ImproperlyConfigured('REDIS_BACKEND = "fake" requires '
+                                       'the fakeredis package')
+
+        class InstrumentedFakeRedis(InstrumentedRedisMixin, fakeredis.FakeRedis):
+            pass
+
+        # Все клиенты процесса работают с одним сервером в памяти
+        return InstrumentedFakeRedis(server=fakeredis.FakeServer())
+    pool = redis.BlockingConnectionPool(host=settings.REDIS_HOST,
+                                        port=settings.REDIS_PORT,
+                                        db=settings.REDIS_DB,
+                                        username=settings.REDIS_USER,
+                                        password=settings.REDIS_PASSWORD,
+                                        **settings.REDIS_POOL_OPTIONS)
+    return InstrumentedRedis(connection_pool=pool)
+
+
+def get_redis():
+    """ Возвращает общий для процесса клиент Redis. Пул соединений
+        сам пересоздает соединения в дочерних процессах после fork()
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_client()
+    return _client
+
+
+def set_redis(client):
+    """ Подменяет общий клиент Redis, например клиентом fakeredis
+        в замерах производительности. Возвращает прежний клиент
+    """
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    return previous
+
+
+def is_available():
+    """ Проверяет, отвечает ли Redis """
+    try:
+        return get_redis().ping()
+    except redis.RedisError:
+        return False
+
+
+def pipeline():
+    """ Конвейер команд без транзакции: все команды отправляются
+        в Redis за один сетевой запрос
+    """
+    return get_redis().pipeline(transaction=False)
+
+
+def execute_batched(items, add_commands, batch_size=None):
+    """ Выполняет команды для большого числа элементов пакетами
+        по batch_size команд. add_commands(pipe, item) добавляет
+        в конвейер команды одного элемента.
+        Возвращает результаты всех команд по порядку
+    """
+    batch_size = batch_size or settings.REDIS_PIPELINE_BATCH_SIZE
+    results = []
+    pipe = pipeline()
+    for item in items:
+        add_commands(pipe, item)
+        if len(pipe) >= batch_size:
+            results.extend(pipe.execute())
+    if len(pipe):
+        results.extend(pipe.execute())
+    return results
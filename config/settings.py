@@ -47,11 +47,11 @@ INSTALLED_APPS = [
     'images.apps.ImagesConfig',
     'easy_thumbnails',
     'actions.apps.ActionsConfig',
-    'debug_toolbar',
+    'benchmarks.apps.BenchmarksConfig',
 ]
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'config.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,11 +61,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Панель отладки подключается только при разработке
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(1, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Шаблонизатор Django, учитывающий время отрисовки, см. config.profiling
+        'BACKEND': 'config.profiling.ProfilingDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -162,7 +168,7 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 # Бэкенды аутентификации
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend', # стандартный
+    'account.authentication.CachedModelBackend', # стандартный с кешированием пользователя
     'account.authentication.EmailAuthBackend', # собственный с применением электронной почты
     'social_core.backends.google.GoogleOAuth2', # аутентификация через учетные данные Google
 ]
@@ -205,3 +211,227 @@ REDIS_PORT = int(os.getenv('REDIS_PORT'))
 REDIS_DB = int(os.getenv('REDIS_DB'))
 REDIS_USER = os.getenv('REDIS_USER')
 REDIS_PASSWORD = os.getenv('REDIS_PASSWORD')
+
+# Источник данных Redis: 'redis' - сервер Redis, 'fake' - имитация Redis
+# в памяти процесса (нужен пакет fakeredis) для тестов и замеров без сервера
+REDIS_BACKEND = os.getenv('REDIS_BACKEND', 'redis')
+
+# Параметры пула соединений с Redis, общего для всех частей проекта.
+# Если все соединения заняты, запрос ждет свободное не дольше timeout
+REDIS_POOL_OPTIONS = {
+    'max_connections': 50,
+    'timeout': 2,
+    'socket_timeout': 1,
+    'socket_connect_timeout': 1,
+    'socket_keepalive': True,
+    'health_check_interval': 30,
+}
+
+# Число команд, отправляемых в Redis одним пакетом
+REDIS_PIPELINE_BATCH_SIZE = 1000
+
+# Число ошибок Redis подряд, после которого обращения к нему
+# на горячих путях временно прекращаются
+REDIS_BREAKER_FAILURES = 3
+
+# Через сколько секунд после прекращения обращений к Redis
+# выполняется пробное обращение
+REDIS_BREAKER_RESET_SECONDS = 10
+
+# Кеш приложения хранится в Redis. Если задать CACHE_BACKEND=locmem,
+# то используется локальная память процесса
+_default_cache = 'locmem' if REDIS_BACKEND == 'fake' else 'redis'
+if os.getenv('CACHE_BACKEND', _default_cache) == 'redis':
+    CACHES = {
+        'default': {
+            # Кеш работает через общий пул соединений config.redis_client
+            'BACKEND': 'config.redis_cache.SharedRedisCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Максимальное число действий в ленте пользователя, хранимой в Redis
+ACTIONS_TIMELINE_SIZE = 200
+
+# Число действий, выводимых на dashboard
+ACTIONS_DASHBOARD_SIZE = 10
+
+# Число потоков, скачивающих изображения в фоне
+IMAGE_INGEST_WORKERS = 4
+
+# Таймауты соединения и чтения при скачивании изображений, в секундах
+IMAGE_DOWNLOAD_TIMEOUT = (3.05, 10)
+
+# Максимальная общая продолжительность скачивания изображения, в секундах
+IMAGE_DOWNLOAD_MAX_SECONDS = 30
+
+# Максимальный размер скачиваемого изображения, в байтах
+IMAGE_DOWNLOAD_MAX_BYTES = 10 * 1024 * 1024
+
+# Размер части, которыми читается тело ответа, в байтах
+IMAGE_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Число соединений в пуле HTTP-сессии одного процесса
+IMAGE_DOWNLOAD_POOL_SIZE = IMAGE_INGEST_WORKERS
+
+# Сколько первых байт файла читать, чтобы определить формат и размеры изображения
+IMAGE_PROBE_BYTES = 64 * 1024
+
+# Размер части, которыми читается начало файла при проверке, в байтах
+IMAGE_PROBE_CHUNK_SIZE = 4 * 1024
+
+# Минимальные размеры добавляемого изображения, в пикселях
+IMAGE_MIN_WIDTH = 250
+IMAGE_MIN_HEIGHT = 250
+
+# Именованные наборы параметров миниатюр. Миниатюры генерируются в фоне
+# при сохранении файла, а шаблоны только выводят их url-адреса
+THUMBNAIL_ALIASES = {
+    'images.Image.image': {
+        'card': {'size': (300, 300), 'crop': 'smart'},
+        'detail': {'size': (300, 0)},
+        'action': {'size': (80, 80), 'crop': '100%'},
+    },
+    'account.Profile.photo': {
+        'avatar': {'size': (180, 180)},
+        'action': {'size': (80, 80), 'crop': '100%'},
+    },
+}
+
+# Число изображений, счетчики просмотров которых переносятся
+# из Redis в базу данных одним запросом
+IMAGE_VIEWS_FLUSH_BATCH = 500
+
+# Число изображений в рейтинге
+IMAGE_RANKING_SIZE = 10
+
+# Время хранения сложенного рейтинга за окно в Redis, в секундах
+IMAGE_RANKING_WINDOW_TTL = 60
+
+# Время кеширования готового рейтинга изображений, в секундах
+IMAGE_RANKING_CACHE_TTL = 60
+
+# Число изображений на одной странице списка
+IMAGE_LIST_PAGE_SIZE = 8
+
+# Время хранения отрисованной карточки изображения в кеше, в секундах
+IMAGE_CARD_CACHE_TTL = 24 * 60 * 60
+
+# Время хранения отрисованной страницы списка изображений в кеше, в секундах
+IMAGE_LIST_CACHE_TTL = 10 * 60
+
+# Число последних поклонников, выводимых на странице изображения
+IMAGE_LIKERS_PREVIEW_SIZE = 12
+
+# Число поклонников изображения на одной странице их списка
+IMAGE_LIKERS_PAGE_SIZE = 24
+
+# Число пользователей на одной странице списка
+USER_LIST_PAGE_SIZE = 24
+
+# Интервал, в течение которого одинаковые действия пользователя
+# не записываются повторно, в секундах
+ACTIONS_DEDUP_SECONDS = 60
+
+# Сколько секунд действует защита от повтора действия, которое
+# еще не записано в базу данных. Если запись не состоится,
+# например процесс будет остановлен, повтор станет возможен
+ACTIONS_DEDUP_PENDING_SECONDS = 10
+
+# Число накопленных за запрос действий, при котором они записываются
+# в базу данных, не дожидаясь окончания запроса
+ACTIONS_BUFFER_SIZE = 100
+
+# Сроки хранения действий по глаголам, в днях. None - хранить бессрочно
+ACTIONS_RETENTION_DAYS = {
+    'likes': 90,
+    'bookmarked image': 365,
+    'is following': 365,
+    'has created an account': None,
+}
+
+# Срок хранения действий с остальными глаголами, в днях
+ACTIONS_RETENTION_DEFAULT_DAYS = 365
+
+# Время хранения пользователя с профилем в кеше аутентификации, в секундах
+AUTH_USER_CACHE_TTL = 15 * 60
+
+# Число изображений, последнее известное число просмотров которых
+# хранится в памяти процесса на время недоступности Redis
+IMAGE_VIEWS_LOCAL_CACHE_SIZE = 10000
+
+# Замеры запросов: заголовок Server-Timing и журнал config.profiling
+PROFILING_ENABLED = True
+
+# Отдавать ли замеры клиенту в заголовке Server-Timing
+PROFILING_SERVER_TIMING = True
+
+# Запросы дольше этого времени записываются в журнал вместе
+# с их самыми долгими SQL-запросами, в миллисекундах
+PROFILING_SLOW_REQUEST_MS = 500
+
+# Число SQL-запросов медленного запроса, записываемых в журнал
+PROFILING_SLOW_SQL = 10
+
+# Наибольшее число SQL-запросов, запоминаемых за один запрос
+PROFILING_MAX_SQL = 200
+
+# Вызывать исключение при превышении объявленного числа SQL-запросов
+# представления (см. config.profiling.query_budget). Включается
+# в тестах и при замерах производительности, иначе превышение
+# только записывается в журнал
+PROFILING_ENFORCE_BUDGETS = False
+
+# Тесты запускаются с проверкой бюджетов SQL-запросов
+TEST_RUNNER = 'config.test_runner.TestRunner'
+
+# Журнал замеров: на уровне INFO записываются все запросы,
+# на уровне WARNING - только медленные и превысившие бюджет
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'config.profiling': {
+            'handlers': ['console'],
+            'level': os.getenv('PROFILING_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+# Поисковый бэкенд изображений. Для баз данных без SQLite FTS5
+# подходит images.search.SimpleSearchBackend
+IMAGE_SEARCH_BACKEND = 'images.search.SQLiteFTSBackend'
+
+# Наибольшее число слов в поисковом запросе
+IMAGE_SEARCH_MAX_WORDS = 8
+
+# Наибольшее число результатов поиска, доступных постранично
+IMAGE_SEARCH_MAX_RESULTS = 1000
+
+# Наибольшее расстояние Хэмминга между перцептивными хешами,
+# при котором изображения считаются одинаковыми, в битах из 64
+IMAGE_DUPLICATE_DISTANCE = 6
+
+# Сколько секунд файл, скачанный по url-адресу, используется без
+# проверки его изменения на сервере
+IMAGE_SOURCE_MAX_AGE = 24 * 60 * 60
+
+# Через сколько секунд неиспользуемый файл общего хранилища
+# может быть удален командой collect_blobs
+IMAGE_BLOB_GC_GRACE = 24 * 60 * 60
+
+# Через сколько секунд обработка изображения считается прерванной,
+# и команда ingest_images возвращает его в очередь. Должно быть
+# заметно больше IMAGE_DOWNLOAD_MAX_SECONDS
+IMAGE_INGEST_STALE_SECONDS = 10 * 60
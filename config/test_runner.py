@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """ Запускает тесты с проверкой бюджетов SQL-запросов представлений:
+        представление, превысившее бюджет, завершается исключением
+        QueryBudgetExceeded, см. config.profiling
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.PROFILING_ENFORCE_BUDGETS = True
@@ -0,0 +1,81 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .profiling import QueryBudgetExceeded
+from .redis_cache import SharedRedisCache
+from .redis_client import get_redis, breaker
+from account import views
+
+
+class ProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_redis().flushall()
+        breaker.success()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        self.client.force_login(self.user)
+
+    def server_timing(self, response):
+        """ Разбирает заголовок Server-Timing в словарь {метрика: параметры} """
+        metrics = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            metrics[name] = dict(param.split('=', 1) for param in params)
+        return metrics
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('dashboard'))
+        metrics = self.server_timing(response)
+        self.assertEqual(set(metrics), {'db', 'redis', 'tpl', 'view', 'total'})
+        self.assertRegex(metrics['db']['desc'], r'^"\d+ queries"$')
+        self.assertGreater(float(metrics['tpl']['dur']), 0)
+        self.assertGreaterEqual(float(metrics['total']['dur']),
+                                float(metrics['view']['dur']))
+
+    @override_settings(PROFILING_SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(PROFILING_SLOW_REQUEST_MS=0, PROFILING_SLOW_SQL=2)
+    def test_slow_request_is_logged_with_sql(self):
+        with self.assertLogs('config.profiling', 'WARNING') as logs:
+            self.client.get(reverse('dashboard'))
+        data = json.loads(logs.records[0].getMessage())
+        self.assertEqual(data['path'], reverse('dashboard'))
+        self.assertEqual(data['status'], 200)
+        self.assertGreater(data['queries'], 0)
+        self.assertEqual(len(data['sql']), 2)
+        self.assertIn('SELECT', data['sql'][0]['sql'])
+
+    def test_fast_request_is_not_logged_as_slow(self):
+        with self.assertNoLogs('config.profiling', 'WARNING'):
+            self.client.get(reverse('dashboard'))
+
+    @override_settings(PROFILING_ENFORCE_BUDGETS=True)
+    def test_budget_is_enforced(self):
+        with mock.patch.object(views.dashboard, 'query_budget', 1), \
+                self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('dashboard'))
+
+
+class SharedRedisCacheTests(TestCase):
+
+    def setUp(self):
+        get_redis().flushall()
+        self.cache = SharedRedisCache('', {})
+
+    def test_cache_uses_shared_client(self):
+        """ Кеш не создает собственный пул соединений """
+        self.assertIs(self.cache._cache.get_client(write=True), get_redis())
+        self.cache.set('greeting', {'text': 'hello'})
+        self.assertTrue(get_redis().exists(self.cache.make_key('greeting')))
+        self.assertEqual(self.cache.get('greeting'), {'text': 'hello'})
+        self.cache.delete('greeting')
+        self.assertIsNone(self.cache.get('greeting'))
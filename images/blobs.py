@@ -0,0 +1,120 @@
+import hashlib
+from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Blob, SourceURL
+from .downloads import fetch
+
+
+def normalize_url(url):
+    """ Приводит url-адрес к единому виду: схема и хост в нижнем регистре,
+        без порта по умолчанию, фрагмента и с упорядоченными параметрами
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname or ''
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        netloc = f'{netloc}:{parts.port}'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def url_hash(url):
+    """ Ключ url-адреса в кеше скачиваний """
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()
+
+
+def blob_name(sha256, extension):
+    """ Путь файла в хранилище. Каталоги по первым символам хеша
+        не дают одному каталогу разрастись до миллионов файлов
+    """
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.{extension}'
+
+
+def get_source(url):
+    """ Возвращает запись кеша скачиваний для url-адреса или None """
+    return SourceURL.objects.select_related('blob') \
+                            .filter(url_hash=url_hash(url)).first()
+
+
+def store_blob(download, extension):
+    """ Сохраняет скачанный файл в хранилище под хешем содержимого.
+        Возвращает кортеж (blob, создан ли он)
+    """
+    blob = Blob.objects.filter(sha256=download.sha256).first()
+    if blob is not None:
+        return blob, False
+    name = blob_name(download.sha256, extension)
+    # Файл мог остаться от прерванной записи: содержимое то же самое
+    if not default_storage.exists(name):
+        name = default_storage.save(name, File(download.file))
+    try:
+        with transaction.atomic():
+            blob = Blob.objects.create(sha256=download.sha256,
+                                       file=name,
+                                       size=download.size)
+    except IntegrityError:
+        # Тот же файл параллельно сохранил другой поток
+        return Blob.objects.get(sha256=download.sha256), False
+    return blob, True
+
+
+def fetch_blob(url, extension, find_similar=None):
+    """ Возвращает файл изображения по url-адресу, скачивая его только
+        при необходимости:
+        - url-адрес уже скачивался недавно - файл берется из кеша;
+        - сервер ответил, что файл не изменился - тоже;
+        - скачанный файл уже есть в хранилище - используется он;
+        - find_similar(file) нашел похожий файл - используется найденный.
+        Иначе файл сохраняется в хранилище.
+        Возвращает кортеж (blob, создан ли он)
+    """
+    now = timezone.now()
+    source = get_source(url)
+    if source is not None and \
+            now - source.checked < timedelta(seconds=settings.IMAGE_SOURCE_MAX_AGE):
+        return source.blob, False
+    download = fetch(url,
+                     etag=source.etag if source else '',
+                     last_modified=source.last_modified if source else '')
+    if download.not_modified:
+        source.checked = now
+        source.save(update_fields=['checked'])
+        return source.blob, False
+    with download.file:
+        blob = Blob.objects.filter(sha256=download.sha256).first()
+        created = False
+        if blob is None and find_similar is not None:
+            blob = find_similar(download.file)
+            download.file.seek(0)
+        if blob is None:
+            blob, created = store_blob(download, extension)
+    SourceURL.objects.update_or_create(url_hash=url_hash(url), defaults={
+        'url': normalize_url(url),
+        'blob': blob,
+        'etag': download.etag[:255],
+        'last_modified': download.last_modified[:64],
+        'checked': now,
+    })
+    return blob, created
+
+
+def acquire(blob_id):
+    """ Учитывает еще одно изображение, использующее файл """
+    Blob.objects.filter(id=blob_id).update(refcount=F('refcount') + 1)
+
+
+def release(blob_id):
+    """ Учитывает удаление изображения, использовавшего файл.
+        Неиспользуемые файлы удаляет команда collect_blobs
+    """
+    Blob.objects.filter(id=blob_id) \
+                .update(refcount=Greatest(F('refcount') - 1, 0))
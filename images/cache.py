@@ -0,0 +1,125 @@
+import time
+import logging
+
+import redis
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+
+CARD_TEMPLATE = 'images/image/card.html'
+LIST_TEMPLATE = 'images/image/list_images.html'
+
+logger = logging.getLogger(__name__)
+
+# Общая версия всех карточек. Меняется, например, после
+# массовой генерации миниатюр
+CARDS_VERSION_KEY = 'image_card:version'
+# Версия списка изображений. Меняется при добавлении
+# и удалении изображений
+LIST_VERSION_KEY = 'image_list:version'
+
+
+def image_version_key(image_id):
+    """ Ключ кеша с версией карточки изображения """
+    return f'image:{image_id}:version'
+
+
+def get_versions(keys):
+    """ Возвращает версии по ключам одним запросом к кешу. Отсутствующие
+        версии создаются заново, поэтому фрагменты, сохраненные со старыми
+        версиями, больше никогда не будут прочитаны
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = time.time_ns()
+            # add() не перезапишет версию, созданную параллельным запросом
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return versions
+
+
+def bump_version(key):
+    """ Делает недействительными все фрагменты, зависящие от версии.
+        Ошибка кеша не должна отменять уже сделанное изменение данных
+    """
+    try:
+        cache.set(key, time.time_ns(), None)
+    except redis.RedisError as e:
+        logger.warning('Failed to bump cache version %s: %s', key, e)
+
+
+def invalidate_image(image_id):
+    """ Сбрасывает закешированную карточку изображения """
+    bump_version(image_version_key(image_id))
+
+
+def invalidate_list():
+    """ Сбрасывает закешированные страницы списка изображений """
+    bump_version(LIST_VERSION_KEY)
+
+
+def invalidate_all_cards():
+    """ Сбрасывает все закешированные карточки изображений """
+    bump_version(CARDS_VERSION_KEY)
+
+
+def render_cards(images):
+    """ Возвращает HTML карточек изображений. Готовые карточки читаются
+        из кеша одним запросом, отрисовываются только недостающие
+    """
+    images = list(images)
+    if not images:
+        return []
+    try:
+        version_keys = [image_version_key(image.id) for image in images]
+        versions = get_versions([CARDS_VERSION_KEY] + version_keys)
+        cards_version = versions[CARDS_VERSION_KEY]
+        card_keys = [f'image_card:{cards_version}:{image.id}:{versions[key]}'
+                     for image, key in zip(images, version_keys)]
+        cached = cache.get_many(card_keys)
+    except redis.RedisError:
+        # Кеш недоступен: просто отрисовываем все карточки
+        return [render_to_string(CARD_TEMPLATE, {'image': image})
+                for image in images]
+    cards = []
+    missing = {}
+    for image, key in zip(images, card_keys):
+        card = cached.get(key)
+        if card is None:
+            card = render_to_string(CARD_TEMPLATE, {'image': image})
+            missing[key] = card
+        cards.append(card)
+    if missing:
+        try:
+            cache.set_many(missing, settings.IMAGE_CARD_CACHE_TTL)
+        except redis.RedisError:
+            pass
+    return cards
+
+
+def cached_list_page(page_key, get_page):
+    """ Возвращает HTML страницы списка и курсор следующей страницы.
+        page_key - ключ страницы, например курсор; get_page - функция,
+        возвращающая страницу изображений, если ее нет в кеше
+    """
+    try:
+        version = get_versions([LIST_VERSION_KEY])[LIST_VERSION_KEY]
+        key = f'image_list:{version}:{page_key}'
+        cached = cache.get(key)
+    except redis.RedisError:
+        key = cached = None
+    if cached is not None:
+        return cached
+    images = get_page()
+    page = (render_to_string(LIST_TEMPLATE, {'images': images}),
+            images.next_cursor)
+    if key is not None:
+        try:
+            cache.set(key, page, settings.IMAGE_LIST_CACHE_TTL)
+        except redis.RedisError:
+            pass
+    return page
@@ -0,0 +1,254 @@
+import uuid
+import threading
+import redis
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.db import IntegrityError, transaction
+from django.db.models import Case, When, F, Value, PositiveIntegerField
+
+from .models import Image, ViewsFlush
+from config.redis_client import get_redis, pipeline, breaker
+
+
+# Ключи Redis
+RANKING_KEY = 'image_ranking'
+# Время жизни рейтингов за час и за сутки, в секундах
+HOURLY_RANKING_TTL = 25 * 60 * 60
+DAILY_RANKING_TTL = 8 * 24 * 60 * 60
+# Просмотры, еще не перенесенные в базу данных
+PENDING_VIEWS_KEY = 'image_views:pending'
+# Просмотры, которые переносятся в базу данных прямо сейчас
+FLUSHING_VIEWS_KEY = 'image_views:flushing'
+# Поле с идентификатором пачки в хеше переносимых просмотров
+FLUSH_BATCH_FIELD = 'batch'
+# Сколько дней хранить записи о перенесенных пачках
+FLUSH_HISTORY_DAYS = 7
+
+# Просмотры, накопленные в памяти процесса, пока Redis недоступен
+_local_views = Counter()
+# Последнее известное число просмотров изображений
+_last_views = {}
+_local_lock = threading.Lock()
+
+
+def hourly_ranking_key(moment):
+    """ Ключ рейтинга просмотров за час, в который попадает moment """
+    return f'{RANKING_KEY}:hour:{moment:%Y%m%d%H}'
+
+
+def daily_ranking_key(moment):
+    """ Ключ рейтинга просмотров за сутки, в которые попадает moment """
+    return f'{RANKING_KEY}:day:{moment:%Y%m%d}'
+
+
+def views_key(image_id):
+    """ Ключ Redis со счетчиком просмотров изображения """
+    return f'image:{image_id}:views'
+
+
+def record_view(image):
+    """ Учитывает просмотр изображения за один запрос к Redis.
+        Возвращает общее число просмотров. Если Redis недоступен,
+        просмотр накапливается в памяти процесса, а возвращается
+        приблизительное число просмотров
+    """
+    if not breaker.allow():
+        return record_local_view(image)
+    try:
+        total_views = record_redis_view(image)
+    except redis.RedisError:
+        breaker.failure()
+        return record_local_view(image)
+    breaker.success()
+    remember_views(image.id, total_views)
+    if _local_views:
+        # Redis снова доступен: переносим в него накопленные просмотры
+        flush_local_views()
+    return total_views
+
+
+def record_redis_view(image):
+    """ Учитывает просмотр изображения в счетчике и рейтингах Redis """
+    now = timezone.now()
+    hour_key = hourly_ranking_key(now)
+    day_key = daily_ranking_key(now)
+    pipe = pipeline()
+    pipe.incr(views_key(image.id))
+    pipe.zincrby(RANKING_KEY, 1, image.id)
+    # Рейтинги за час и за сутки удаляются сами, когда
+    # перестают попадать в окна, см. images.ranking
+    pipe.zincrby(hour_key, 1, image.id)
+    pipe.expire(hour_key, HOURLY_RANKING_TTL)
+    pipe.zincrby(day_key, 1, image.id)
+    pipe.expire(day_key, DAILY_RANKING_TTL)
+    pipe.hincrby(PENDING_VIEWS_KEY, image.id, 1)
+    total_views = pipe.execute()[0]
+    if total_views == 1 and image.total_views:
+        # Счетчика не было в Redis, хотя в базе данных просмотры есть:
+        # Redis был очищен. Добавляем просмотры, сохраненные в базе данных
+        pipe = pipeline()
+        pipe.incrby(views_key(image.id), image.total_views)
+        pipe.zincrby(RANKING_KEY, image.total_views, image.id)
+        total_views = pipe.execute()[0]
+    return total_views
+
+
+def remember_views(image_id, total_views):
+    """ Запоминает число просмотров на случай недоступности Redis """
+    with _local_lock:
+        if len(_last_views) >= settings.IMAGE_VIEWS_LOCAL_CACHE_SIZE:
+            _last_views.clear()
+        _last_views[image_id] = total_views
+
+
+def record_local_view(image):
+    """ Учитывает просмотр в памяти процесса. Возвращает приблизительное
+        число просмотров: последнее известное или сохраненное в базе
+        данных вместе с накопленными в процессе
+    """
+    with _local_lock:
+        _local_views[image.id] += 1
+        local = _local_views[image.id]
+        known = _last_views.get(image.id, 0)
+    return max(known, image.total_views) + local
+
+
+def flush_local_views():
+    """ Переносит накопленные в памяти процесса просмотры в Redis
+        одним конвейером. Возвращает число изображений
+    """
+    global _local_views
+    with _local_lock:
+        views, _local_views = _local_views, Counter()
+    if not views:
+        return 0
+    now = timezone.now()
+    hour_key = hourly_ranking_key(now)
+    day_key = daily_ranking_key(now)
+    items = list(views.items())
+    pipe = pipeline()
+    for image_id, count in items:
+        pipe.incrby(views_key(image_id), count)
+        pipe.zincrby(RANKING_KEY, count, image_id)
+        pipe.zincrby(hour_key, count, image_id)
+        pipe.zincrby(day_key, count, image_id)
+        pipe.hincrby(PENDING_VIEWS_KEY, image_id, count)
+    pipe.expire(hour_key, HOURLY_RANKING_TTL)
+    pipe.expire(day_key, DAILY_RANKING_TTL)
+    try:
+        results = pipe.execute()
+    except redis.RedisError:
+        breaker.failure()
+        # Возвращаем просмотры обратно, они будут перенесены позже
+        with _local_lock:
+            _local_views.update(views)
+        return 0
+    # Счетчики, которых не было в Redis, дополняем просмотрами
+    # из базы данных, как в record_redis_view()
+    missing = [image_id for index, (image_id, count) in enumerate(items)
+               if results[index * 5] == count]
+    if missing:
+        totals = Image.objects.filter(id__in=missing, total_views__gt=0) \
+                              .values_list('id', 'total_views')
+        pipe = pipeline()
+        for image_id, total_views in totals:
+            pipe.incrby(views_key(image_id), total_views)
+            pipe.zincrby(RANKING_KEY, total_views, image_id)
+        try:
+            pipe.execute()
+        except redis.RedisError:
+            breaker.failure()
+    return len(items)
+
+
+def apply_view_deltas(deltas):
+    """ Прибавляет накопленные просмотры к счетчикам в базе данных.
+        Каждая пачка изображений обновляется одним запросом
+    """
+    items = [(int(image_id), int(delta)) for image_id, delta in deltas.items()]
+    batch_size = settings.IMAGE_VIEWS_FLUSH_BATCH
+    for i in range(0, len(items), batch_size):
+        batch = items[i:i + batch_size]
+        whens = [When(id=image_id, then=F('total_views') + Value(delta))
+                 for image_id, delta in batch]
+        total_views = Case(*whens, default=F('total_views'),
+                           output_field=PositiveIntegerField())
+        Image.objects.filter(id__in=[image_id for image_id, _ in batch]) \
+                     .update(total_views=total_views)
+    return len(items)
+
+
+def flush_views():
+    """ Переносит накопленные в Redis просмотры в базу данных.
+        Возвращает число обновленных изображений
+    """
+    r = get_redis()
+    # Если предыдущий перенос был прерван, сначала завершаем его
+    if not r.exists(FLUSHING_VIEWS_KEY):
+        if not r.exists(PENDING_VIEWS_KEY):
+            # Новых просмотров нет
+            return 0
+        # Переименование атомарно: новые просмотры продолжают
+        # накапливаться под прежним ключом. Пачка получает
+        # идентификатор в той же транзакции Redis
+        pipe = r.pipeline()
+        pipe.rename(PENDING_VIEWS_KEY, FLUSHING_VIEWS_KEY)
+        pipe.hset(FLUSHING_VIEWS_KEY, FLUSH_BATCH_FIELD, uuid.uuid4().hex)
+        pipe.execute()
+    deltas = r.hgetall(FLUSHING_VIEWS_KEY)
+    batch = deltas.pop(FLUSH_BATCH_FIELD.encode(), b'').decode()
+    # Пачка, оставшаяся от версии без идентификаторов, переносится как новая
+    batch = batch or uuid.uuid4().hex
+    try:
+        with transaction.atomic():
+            ViewsFlush.objects.create(batch=batch)
+            total = apply_view_deltas(deltas)
+    except IntegrityError:
+        # Пачка уже перенесена, но процесс остановился до удаления
+        # ее из Redis. Повторно просмотры не прибавляем
+        total = 0
+    r.delete(FLUSHING_VIEWS_KEY)
+    ViewsFlush.objects.filter(
+        created__lt=timezone.now() - timedelta(days=FLUSH_HISTORY_DAYS)).delete()
+    return total
+
+
+def seed_views():
+    """ Восстанавливает рейтинг и счетчики просмотров в пустом Redis
+        по данным из базы данных. Возвращает число изображений
+    """
+    images = Image.objects.filter(total_views__gt=0) \
+                          .values_list('id', 'total_views')
+    total = 0
+    batch_size = settings.IMAGE_VIEWS_FLUSH_BATCH
+    batch = []
+    for item in images.iterator(chunk_size=batch_size):
+        batch.append(item)
+        if len(batch) == batch_size:
+            total += seed_batch(batch)
+            batch = []
+    if batch:
+        total += seed_batch(batch)
+    return total
+
+
+def seed_batch(batch):
+    """ Заносит в Redis счетчики пачки изображений """
+    pipe = pipeline()
+    for image_id, _ in batch:
+        pipe.get(views_key(image_id))
+        pipe.hget(PENDING_VIEWS_KEY, image_id)
+    values = pipe.execute()
+    pipe = pipeline()
+    for index, (image_id, total_views) in enumerate(batch):
+        current, pending = values[index * 2], values[index * 2 + 1]
+        if current is None:
+            # Просмотры, уже учтенные в базе данных, и еще не перенесенные
+            current = total_views + int(pending or 0)
+            pipe.set(views_key(image_id), current, nx=True)
+        pipe.zadd(RANKING_KEY, {image_id: int(current)})
+    pipe.execute()
+    return len(batch)
@@ -0,0 +1,191 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import requests
+
+from PIL import Image, ImageFile
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadError(Exception):
+    """ Ошибка скачивания удаленного файла """
+
+
+class DownloadStats:
+    """ Счетчики скачиваний процесса для планирования нагрузки """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.downloads = 0
+            self.failures = 0
+            self.bytes = 0
+            self.seconds = 0.0
+
+    def record(self, size, duration, failed=False):
+        with self._lock:
+            self.downloads += 1
+            self.bytes += size
+            self.seconds += duration
+            if failed:
+                self.failures += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'downloads': self.downloads,
+                'failures': self.failures,
+                'bytes': self.bytes,
+                'seconds': round(self.seconds, 3),
+            }
+
+
+stats = DownloadStats()
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """ Возвращает общую для процесса HTTP-сессию с пулом соединений.
+        После fork() дочерний процесс создает собственную сессию
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=settings.IMAGE_DOWNLOAD_POOL_SIZE,
+                                  pool_maxsize=settings.IMAGE_DOWNLOAD_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+class Download:
+    """ Результат скачивания. Если файл не изменился с прошлого
+        скачивания (ответ 304), то file равен None
+    """
+
+    def __init__(self, file=None, size=0, sha256=None,
+                 etag='', last_modified=''):
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def not_modified(self):
+        return self.file is None
+
+
+def fetch(url, max_bytes=None, etag='', last_modified=''):
+    """ Скачивает файл во временный файл по частям, вычисляя по пути
+        его хеш SHA-256. Прерывает скачивание, как только размер
+        превышает max_bytes. Если переданы etag или last_modified
+        прошлого скачивания, то запрос условный: неизмененный файл
+        сервер не отдает. Временный файл открыт на чтение с начала
+    """
+    if max_bytes is None:
+        max_bytes = settings.IMAGE_DOWNLOAD_MAX_BYTES
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    started = time.monotonic()
+    size = 0
+    digest = hashlib.sha256()
+    tmp = tempfile.TemporaryFile()
+    try:
+        with get_session().get(url, headers=headers, stream=True,
+                               timeout=settings.IMAGE_DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                tmp.close()
+                stats.record(size, time.monotonic() - started)
+                logger.info('%s is not modified', url)
+                return Download(etag=etag, last_modified=last_modified)
+            # Заявленный размер проверяем до начала чтения тела ответа
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit() and int(length) > max_bytes:
+                raise DownloadError(f'File is too large: {length} bytes')
+            for chunk in response.iter_content(settings.IMAGE_DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise DownloadError(f'File exceeds {max_bytes} bytes')
+                if time.monotonic() - started > settings.IMAGE_DOWNLOAD_MAX_SECONDS:
+                    raise DownloadError('Download took too long')
+                digest.update(chunk)
+                tmp.write(chunk)
+    except (requests.RequestException, DownloadError) as e:
+        tmp.close()
+        duration = time.monotonic() - started
+        stats.record(size, duration, failed=True)
+        logger.warning('Download of %s failed after %d bytes in %.2fs: %s',
+                       url, size, duration, e)
+        if isinstance(e, DownloadError):
+            raise
+        raise DownloadError(str(e)) from e
+    duration = time.monotonic() - started
+    stats.record(size, duration)
+    logger.info('Downloaded %s: %d bytes in %.2fs', url, size, duration)
+    tmp.seek(0)
+    return Download(tmp, size, digest.hexdigest(),
+                    response.headers.get('ETag', ''),
+                    response.headers.get('Last-Modified', ''))
+
+
+def download(url, max_bytes=None):
+    """ Скачивает файл безусловно. Возвращает временный файл,
+        открытый на чтение с начала
+    """
+    return fetch(url, max_bytes).file
+
+
+def probe(url, max_bytes=None):
+    """ Определяет формат и размеры изображения по первым байтам файла,
+        не скачивая его целиком. Возвращает кортеж (формат, ширина, высота)
+    """
+    if max_bytes is None:
+        max_bytes = settings.IMAGE_PROBE_BYTES
+    started = time.monotonic()
+    size = 0
+    parser = ImageFile.Parser()
+    # Просим сервер отдать только начало файла. Если он не поддерживает
+    # Range, то прекращаем чтение, как только разобран заголовок
+    headers = {'Range': f'bytes=0-{max_bytes - 1}'}
+    try:
+        with get_session().get(url, headers=headers, stream=True,
+                               timeout=settings.IMAGE_DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(settings.IMAGE_PROBE_CHUNK_SIZE):
+                size += len(chunk)
+                parser.feed(chunk)
+                if parser.image is not None or size >= max_bytes:
+                    break
+    except (requests.RequestException, Image.DecompressionBombError,
+            OSError, SyntaxError, ValueError) as e:
+        # Кроме сетевых ошибок, Pillow может отвергнуть испорченный
+        # или подделанный заголовок изображения
+        stats.record(size, time.monotonic() - started, failed=True)
+        logger.warning('Probe of %s failed: %s', url, e)
+        raise DownloadError(str(e)) from e
+    stats.record(size, time.monotonic() - started)
+    if parser.image is None:
+        raise DownloadError(f'No image header in the first {size} bytes')
+    width, height = parser.image.size
+    return parser.image.format, width, height
@@ -1,10 +1,9 @@
-import requests
-
 from django import forms
-from django.core.files.base import ContentFile
-from django.utils.text import slugify
+from django.conf import settings
 
 from .models import Image
+from .downloads import probe, DownloadError
+from .blobs import get_source
 
 
 class ImageCreateForm(forms.ModelForm):
@@ -22,17 +21,25 @@ class ImageCreateForm(forms.ModelForm):
         extension = url.rsplit('.', 1)[1].lower()
         if extension not in valid_extension:
             raise forms.ValidationError('The given URL does not match valid image extensions.')
+        if get_source(url) is not None:
+            # Изображение по этому адресу уже скачивалось и прошло проверку
+            return url
+        # Проверяем реальный формат и размеры изображения
+        # до того, как скачивать его целиком
+        try:
+            image_format, width, height = probe(url)
+        except DownloadError:
+            raise forms.ValidationError('The given URL could not be loaded as an image.')
+        if image_format not in ('JPEG', 'PNG'):
+            raise forms.ValidationError('The given URL does not point to a JPEG or PNG image.')
+        if width < settings.IMAGE_MIN_WIDTH or height < settings.IMAGE_MIN_HEIGHT:
+            raise forms.ValidationError('The image is too small.')
         return url
     
     def save(self, force_insert=False, force_update=False, commit=True):
         image = super().save(commit=False)
-        image_url = self.cleaned_data['url']
-        name = slugify(image.title)
-        extension = image_url.rsplit('.', 1)[1].lower()
-        image_name = f'{name}.{extension}'
-        # Скачиваем изображение с данного url-адреса
-        response = requests.get(image_url)
-        image.image.save(image_name, ContentFile(response.content), save=False)
+        # Файл изображения скачивается в фоне, см. images.ingest
+        image.status = Image.Status.PENDING
         if commit:
             image.save()
         return image
@@ -0,0 +1,133 @@
+import logging
+
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from easy_thumbnails.signals import saved_file
+
+from .models import Image
+from .blobs import fetch_blob, acquire
+from .phash import dhash, find_duplicate
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    """ Возвращает пул потоков процесса, в котором скачиваются изображения """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_INGEST_WORKERS,
+                                       thread_name_prefix='image-ingest')
+    return _executor
+
+
+def enqueue(image):
+    """ Ставит скачивание изображения в очередь после фиксации транзакции """
+    transaction.on_commit(lambda: get_executor().submit(process_image, image.id))
+
+
+def claim(image_id):
+    """ Захватывает изображение для обработки. Обновление выполняется
+        одним запросом, поэтому одно изображение не обработают дважды.
+        Возвращает время захвата или None, если изображение уже захвачено
+    """
+    started = timezone.now()
+    updated = Image.objects.filter(id=image_id,
+                                   status=Image.Status.PENDING) \
+                           .update(status=Image.Status.PROCESSING,
+                                   processing_started=started)
+    return started if updated == 1 else None
+
+
+def requeue_stale():
+    """ Возвращает в очередь изображения, обработка которых не завершилась
+        за IMAGE_INGEST_STALE_SECONDS, например из-за остановки процесса.
+        Возвращает их число
+    """
+    stale = timezone.now() - timedelta(seconds=settings.IMAGE_INGEST_STALE_SECONDS)
+    return Image.objects.filter(Q(processing_started__lt=stale) |
+                                Q(processing_started__isnull=True),
+                                status=Image.Status.PROCESSING) \
+                        .update(status=Image.Status.PENDING)
+
+
+def download_image(image):
+    """ Получает файл изображения по его url-адресу через общее хранилище
+        файлов, см. images.blobs. Повторная закладка того же адреса или
+        того же изображения не скачивает и не сохраняет файл заново.
+        Возвращает True, если в хранилище появился новый файл
+    """
+    extension = image.url.rsplit('.', 1)[1].lower()
+
+    def find_similar(file):
+        image.phash = dhash(file)
+        original = find_duplicate(image.phash, exclude_id=image.id)
+        if original is None:
+            return None
+        # Копия с другого адреса или другого размера
+        image.duplicate_of = original
+        return original.blob
+
+    blob, created = fetch_blob(image.url, extension, find_similar)
+    if image.phash is None:
+        # Файл уже был в хранилище: хеш и оригинал берем
+        # у другого изображения с тем же файлом
+        other = blob.images.filter(status=Image.Status.READY) \
+                           .exclude(id=image.id).order_by('id').first()
+        if other is not None:
+            image.phash = other.phash
+            image.duplicate_of_id = other.duplicate_of_id or other.id
+        if image.phash is None:
+            with blob.file.open('rb') as file:
+                image.phash = dhash(file)
+    image.blob = blob
+    image.image.name = blob.file.name
+    return created
+
+
+def process_image(image_id):
+    """ Скачивает и сохраняет изображение, после чего помечает его готовым """
+    try:
+        started = claim(image_id)
+        if started is None:
+            return False
+        image = Image.objects.get(id=image_id)
+        # Изображение все еще обрабатывается этим потоком, а не возвращено
+        # в очередь и захвачено заново
+        claimed = Image.objects.filter(id=image_id,
+                                       status=Image.Status.PROCESSING,
+                                       processing_started=started)
+        try:
+            created = download_image(image)
+        except Exception:
+            logger.exception('Failed to download image %s from %s',
+                             image.id, image.url)
+            claimed.update(status=Image.Status.FAILED)
+            return False
+        with transaction.atomic():
+            # Условное обновление блокирует строку: из двух потоков,
+            # обработавших одно изображение, результат сохранит один
+            if not claimed.update(status=Image.Status.READY):
+                return False
+            image.status = Image.Status.READY
+            image.hashed = timezone.now()
+            image.save(update_fields=['image', 'blob', 'status',
+                                      'phash', 'hashed', 'duplicate_of'])
+            acquire(image.blob_id)
+        if created:
+            # Файл сохранен в хранилище до сохранения модели, поэтому
+            # easy_thumbnails сам не отправит этот сигнал. У файлов,
+            # которые уже были в хранилище, миниатюры уже есть
+            saved_file.send_robust(sender=Image, fieldfile=image.image)
+        return True
+    finally:
+        # Поток пула живет дольше запроса, поэтому закрываем
+        # соединение с базой данных самостоятельно
+        close_old_connections()
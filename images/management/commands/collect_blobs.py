@@ -0,0 +1,51 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from easy_thumbnails.files import get_thumbnailer
+
+from images.models import Blob
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """ Удаляет файлы общего хранилища, которые не использует
+        ни одно изображение, вместе с их миниатюрами
+    """
+    help = 'Delete unreferenced content-addressed image files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count unreferenced files')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=settings.IMAGE_BLOB_GC_GRACE)
+        # Счетчику ссылок не доверяем полностью: файл удаляется, только
+        # если на него действительно не ссылается ни одно изображение.
+        # Свежие файлы не трогаем, их изображения могут еще сохраняться
+        blobs = Blob.objects.filter(refcount=0, created__lt=cutoff) \
+                            .annotate(total=Count('images')) \
+                            .filter(total=0)
+        if options['dry_run']:
+            self.stdout.write(f'{blobs.count()} unreferenced files')
+            return
+        deleted = 0
+        freed = 0
+        for blob in blobs.iterator():
+            try:
+                get_thumbnailer(blob.file).delete_thumbnails()
+                default_storage.delete(blob.file.name)
+            except Exception:
+                logger.exception('Failed to delete %s', blob.file.name)
+                continue
+            blob.delete()
+            deleted += 1
+            freed += blob.size
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} files, freed {freed / 1024 / 1024:.1f} MiB'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from config.redis_client import get_redis
+from images.counters import RANKING_KEY, flush_views, seed_views
+
+
+class Command(BaseCommand):
+    """ Переносит просмотры изображений из Redis в базу данных.
+        Предназначена для периодического запуска, например, из cron
+    """
+    help = 'Flush image view counters from Redis to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help='Re-seed Redis counters from the database')
+
+    def handle(self, *args, **options):
+        if options['seed'] or not get_redis().exists(RANKING_KEY):
+            # Redis запущен с пустой базой, восстанавливаем рейтинг
+            seeded = seed_views()
+            self.stdout.write(f'Seeded {seeded} images from the database')
+        flushed = flush_views()
+        self.stdout.write(self.style.SUCCESS(
+            f'Flushed view counters of {flushed} images'))
@@ -0,0 +1,80 @@
+import django
+import logging
+
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.db import connections
+from django.core.management.base import BaseCommand
+
+from images.thumbnails import generate_thumbnails
+from images.cache import invalidate_all_cards, invalidate_list
+
+
+logger = logging.getLogger(__name__)
+
+# Модели и поля, миниатюры которых генерирует команда
+SOURCES = (
+    ('images.Image', 'image'),
+    ('account.Profile', 'photo'),
+)
+
+
+def init_worker():
+    """ Подготавливает процесс пула к работе с Django """
+    django.setup()
+    # Соединения, унаследованные от родительского процесса, не используем
+    connections.close_all()
+
+
+def generate_chunk(model_label, field_name, ids):
+    """ Генерирует миниатюры для пачки объектов одной модели """
+    model = apps.get_model(model_label)
+    total = 0
+    for obj in model.objects.filter(pk__in=ids):
+        fieldfile = getattr(obj, field_name)
+        if not fieldfile:
+            continue
+        try:
+            generate_thumbnails(fieldfile)
+        except Exception:
+            logger.exception('Failed to generate thumbnails for %s',
+                             fieldfile.name)
+            continue
+        total += 1
+    return total
+
+
+class Command(BaseCommand):
+    """ Генерирует миниатюры для всех ранее сохраненных изображений """
+    help = 'Pre-generate thumbnails for every alias across the media library'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Number of objects handled by a worker at once')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        jobs = []
+        for model_label, field_name in SOURCES:
+            model = apps.get_model(model_label)
+            ids = list(model.objects.exclude(**{field_name: ''})
+                                    .values_list('pk', flat=True))
+            for i in range(0, len(ids), chunk_size):
+                jobs.append((model_label, field_name, ids[i:i + chunk_size]))
+        # Закрываем соединения перед запуском процессов пула
+        connections.close_all()
+        total = 0
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 initializer=init_worker) as executor:
+            futures = [executor.submit(generate_chunk, *job) for job in jobs]
+            for future in futures:
+                total += future.result()
+        # Карточки и страницы списка с url-адресами исходных
+        # файлов больше не нужны
+        invalidate_all_cards()
+        invalidate_list()
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated thumbnails for {total} files'))
@@ -0,0 +1,66 @@
+import django
+import logging
+
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connections
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+
+from images.models import Image
+from images.phash import dhash
+
+
+logger = logging.getLogger(__name__)
+
+
+def init_worker():
+    """ Подготавливает процесс пула к работе с Django """
+    django.setup()
+    # Соединения, унаследованные от родительского процесса, не используем
+    connections.close_all()
+
+
+def hash_chunk(ids):
+    """ Вычисляет перцептивные хеши пачки изображений """
+    hashed = []
+    for image in Image.objects.filter(id__in=ids).only('id', 'image'):
+        try:
+            with image.image.open('rb') as file:
+                image.phash = dhash(file)
+            image.hashed = timezone.now()
+        except Exception:
+            logger.exception('Failed to hash %s', image.image.name)
+            continue
+        hashed.append(image)
+    Image.objects.bulk_update(hashed, ['phash', 'hashed'])
+    return len(hashed)
+
+
+class Command(BaseCommand):
+    """ Вычисляет перцептивные хеши ранее сохраненных изображений """
+    help = 'Compute perceptual hashes of existing images in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes')
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Number of images hashed by a worker at once')
+        parser.add_argument('--all', action='store_true',
+                            help='Rehash images that already have a hash')
+
+    def handle(self, *args, **options):
+        images = Image.objects.exclude(image='')
+        if not options['all']:
+            images = images.filter(phash__isnull=True)
+        ids = list(images.values_list('id', flat=True))
+        chunk_size = options['chunk_size']
+        chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+        # Закрываем соединения перед запуском процессов пула
+        connections.close_all()
+        total = 0
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 initializer=init_worker) as executor:
+            for hashed in executor.map(hash_chunk, chunks):
+                total += hashed
+        self.stdout.write(self.style.SUCCESS(f'Hashed {total} images'))
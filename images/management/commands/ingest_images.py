@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from images.models import Image
+from images.ingest import get_executor, process_image, requeue_stale
+
+
+class Command(BaseCommand):
+    """ Локальный обработчик очереди скачивания изображений """
+    help = 'Download pending bookmarked images using a local worker pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process the current queue and exit')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between queue polls')
+
+    def handle(self, *args, **options):
+        executor = get_executor()
+        while True:
+            # Изображения, обработка которых была прервана остановкой
+            # процесса, возвращаем в очередь. Изображения, которые еще
+            # обрабатываются пулами веб-процессов, не трогаем
+            requeue_stale()
+            image_ids = list(Image.objects.filter(status=Image.Status.PENDING)
+                                          .values_list('id', flat=True))
+            results = list(executor.map(process_image, image_ids))
+            if image_ids:
+                self.stdout.write(f'Processed {results.count(True)} '
+                                  f'of {len(image_ids)} images')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from images.search import get_backend
+
+
+class Command(BaseCommand):
+    """ Строит заново поисковый индекс изображений """
+    help = 'Rebuild the full-text search index of images'
+
+    def handle(self, *args, **options):
+        total = get_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} images'))
@@ -0,0 +1,43 @@
+from django.db.models import Count
+from django.core.management.base import BaseCommand
+
+from images.models import Image
+
+
+class Command(BaseCommand):
+    """ Пересчитывает счетчики лайков изображений, если они разошлись """
+    help = 'Recompute drifted Image.total_likes counters in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of images checked per query')
+
+    def handle(self, *args, **options):
+        through = Image.users_like.through
+        chunk_size = options['chunk_size']
+        last_id = 0
+        checked = fixed = 0
+        while True:
+            chunk = list(Image.objects.filter(id__gt=last_id)
+                                      .order_by('id')
+                                      .only('id', 'total_likes')[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            # Настоящее число лайков всей пачки одним сгруппированным запросом
+            counts = dict(through.objects.filter(image_id__in=[i.id for i in chunk])
+                                         .values('image_id')
+                                         .annotate(total=Count('id'))
+                                         .values_list('image_id', 'total'))
+            drifted = []
+            for image in chunk:
+                total = counts.get(image.id, 0)
+                if image.total_likes != total:
+                    image.total_likes = total
+                    drifted.append(image)
+            if drifted:
+                Image.objects.bulk_update(drifted, ['total_likes'])
+            checked += len(chunk)
+            fixed += len(drifted)
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} images, fixed {fixed} counters'))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 18:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0002_image_total_likes_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='image',
+            field=models.ImageField(blank=True, upload_to='images/%Y/%m/%d/'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['status'], name='images_imag_status_24608f_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0003_image_status_alter_image_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='total_views',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+FTS_TABLE = 'images_image_fts'
+
+
+def create_index(apps, schema_editor):
+    # Полнотекстовый индекс FTS5 есть только в SQLite, для других баз
+    # данных нужно выбрать другой бэкенд в IMAGE_SEARCH_BACKEND
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"title, description, tokenize='unicode61 remove_diacritics 2')")
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, title, description) "
+        f"SELECT id, title, description FROM images_image WHERE status = 'ready'")
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0005_image_images_imag_user_id_efc684_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 18:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0006_image_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='images.image'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='phash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
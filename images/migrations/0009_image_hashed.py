@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0008_blob_sourceurl'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='hashed',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0009_image_hashed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='processing_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 19:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0011_viewsflush'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['-total_views'], name='images_imag_total_v_df67af_idx'),
+        ),
+    ]
@@ -4,26 +4,97 @@ from django.utils.text import slugify
 from django.urls import reverse
 
 
+class Blob(models.Model):
+    """ Файл изображения в хранилище, адресуемый хешем SHA-256 своего
+        содержимого. Изображения с одинаковым содержимым используют
+        один файл и одни миниатюры, см. images.blobs
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.ImageField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # Число изображений, использующих файл
+    refcount = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
+class SourceURL(models.Model):
+    """ Скачанный url-адрес и файл, полученный по нему. Заголовки ETag
+        и Last-Modified позволяют проверить, не изменился ли файл,
+        не скачивая его заново
+    """
+    # SHA-256 нормализованного url-адреса: короткий уникальный ключ
+    url_hash = models.CharField(max_length=64, unique=True)
+    url = models.URLField(max_length=2000)
+    blob = models.ForeignKey(Blob,
+                             related_name='sources',
+                             on_delete=models.CASCADE)
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    checked = models.DateTimeField()
+
+    def __str__(self):
+        return self.url
+
+
 class Image(models.Model):
     """ Модель для хранения изображений на платформе """
+
+    class Status(models.TextChoices):
+        """ Состояния загрузки файла изображения """
+        PENDING = 'pending', 'Pending'
+        PROCESSING = 'processing', 'Processing'
+        READY = 'ready', 'Ready'
+        FAILED = 'failed', 'Failed'
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, 
                              related_name='images_created', 
                              on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, blank=True)
     url = models.URLField(max_length=2000)
-    image = models.ImageField(upload_to='images/%Y/%m/%d/')
+    image = models.ImageField(upload_to='images/%Y/%m/%d/', blank=True)
+    # Файл изображения в общем хранилище. У изображений, сохраненных
+    # до его появления, файл лежит отдельно и blob не задан
+    blob = models.ForeignKey(Blob,
+                             related_name='images',
+                             null=True,
+                             blank=True,
+                             on_delete=models.PROTECT)
     description = models.TextField(blank=True)
     created = models.DateField(auto_now_add=True)
     users_like = models.ManyToManyField(settings.AUTH_USER_MODEL,
                                         related_name='images_liked',
                                         blank=True)
     total_likes = models.PositiveIntegerField(default=0)
+    # Просмотры, перенесенные из Redis командой flush_views
+    total_views = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10,
+                              choices=Status,
+                              default=Status.READY)
+    # Когда изображение было захвачено на обработку, см. images.ingest
+    processing_started = models.DateTimeField(null=True, blank=True)
+    # Перцептивный хеш файла для поиска похожих изображений, см. images.phash
+    phash = models.BigIntegerField(null=True, blank=True)
+    # Когда хеш был вычислен. По этому времени процессы дополняют
+    # свои индексы хешей, см. images.phash.DuplicateIndex
+    hashed = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Изображение, копией которого является это. Копия использует его файл
+    duplicate_of = models.ForeignKey('self',
+                                     related_name='duplicates',
+                                     null=True,
+                                     blank=True,
+                                     on_delete=models.SET_NULL)
 
     class Meta:
         indexes = [
             models.Index(fields=['-created']),
             models.Index(fields=['-total_likes']),
+            models.Index(fields=['-total_views']),
+            models.Index(fields=['status']),
+            models.Index(fields=['user', '-created']),
         ]
         ordering = ['-created']
 
@@ -40,3 +111,15 @@ class Image(models.Model):
     def get_absolute_url(self):
         return reverse('images:detail', args=[self.id, self.slug])
     
+
+
+class ViewsFlush(models.Model):
+    """ Пачка просмотров, перенесенная из Redis в базу данных.
+        Записывается в одной транзакции с самими просмотрами, поэтому
+        повторный перенос той же пачки будет пропущен, см. images.counters
+    """
+    batch = models.CharField(max_length=32, unique=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.batch
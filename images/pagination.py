@@ -0,0 +1,105 @@
+import json
+import base64
+import binascii
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """ Страница результатов постраничной навигации по ключу (курсору) """
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(values):
+    """ Упаковывает значения ключа последнего объекта страницы в строку """
+    data = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor, size):
+    """ Распаковывает курсор. Для пустого или испорченного курсора
+        возвращает None, то есть первую страницу
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def cursor_values(model, cursor, ordering):
+    """ Распаковывает курсор и приводит его значения к типам полей
+        сортировки. Для подделанного курсора тоже возвращает None
+    """
+    values = decode_cursor(cursor, len(ordering))
+    if values is None:
+        return None
+    try:
+        result = []
+        for name, value in zip(ordering, values):
+            field = model._meta.get_field(name.lstrip('-'))
+            value = field.to_python(value)
+            # Валидаторы отсекают, например, числа вне диапазона столбца
+            field.run_validators(value)
+            result.append(value)
+    except (ValidationError, ValueError, TypeError):
+        return None
+    if None in result:
+        return None
+    return result
+
+
+def normalize_cursor(model, cursor, ordering):
+    """ Возвращает курсор в едином виде, для первой страницы - пустую строку.
+        Годится в ключ кеша: разные записи одного и того же курсора
+        и подделанные курсоры не создают новых ключей
+    """
+    values = cursor_values(model, cursor, ordering)
+    if values is None:
+        return ''
+    return encode_cursor(values)
+
+
+def keyset_page(queryset, cursor, per_page, ordering):
+    """ Возвращает страницу queryset, следующую за курсором.
+        Вместо OFFSET и COUNT(*) используется условие по ключу сортировки,
+        поэтому любая страница стоит столько же, сколько первая.
+        ordering - поля сортировки, последнее из них должно быть уникальным,
+        например ('-created', '-id')
+    """
+    queryset = queryset.order_by(*ordering)
+    fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+    values = cursor_values(queryset.model, cursor, ordering)
+    if values is not None:
+        # Лексикографическое сравнение: (a < x) OR (a = x AND b < y) ...
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(fields, values):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        queryset = queryset.filter(condition)
+    object_list = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(object_list) > per_page:
+        object_list = object_list[:per_page]
+        last = object_list[-1]
+        next_cursor = encode_cursor([getattr(last, name) for name, _ in fields])
+    return KeysetPage(object_list, next_cursor)
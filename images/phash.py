@@ -0,0 +1,152 @@
+import threading
+from datetime import timedelta
+
+from PIL import Image as PILImage
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Image
+
+
+# Размер хеша: 8 x 8 = 64 бита
+HASH_SIZE = 8
+
+# Время hashed задается до фиксации транзакции, поэтому при дополнении
+# индекса изображения просматриваются с запасом на ее длительность
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+
+def to_signed(value):
+    """ Приводит 64-битное беззнаковое число к знаковому для BigIntegerField """
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def dhash(file):
+    """ Вычисляет разностный хеш (dHash) изображения: каждый бит
+        показывает, ярче ли пиксель своего правого соседа в уменьшенной
+        до 9 x 8 копии в оттенках серого. Похожие изображения разного
+        размера и качества сжатия получают близкие хеши
+    """
+    with PILImage.open(file) as picture:
+        # Для JPEG декодируем сразу уменьшенную копию, это намного быстрее
+        picture.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        small = picture.convert('L').resize((HASH_SIZE + 1, HASH_SIZE),
+                                            PILImage.Resampling.LANCZOS)
+        pixels = list(small.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            index = row * (HASH_SIZE + 1) + col
+            value = value << 1 | (pixels[index] > pixels[index + 1])
+    return to_signed(value)
+
+
+def distance(a, b):
+    """ Расстояние Хэмминга между хешами: число различающихся битов """
+    return ((a ^ b) & ((1 << 64) - 1)).bit_count()
+
+
+class BKTree:
+    """ BK-дерево для поиска хешей в пределах расстояния Хэмминга.
+        Просматривает только ветви, которые могут содержать ответ,
+        а не все хеши. Узел: [хеш, элементы, {расстояние: потомок}]
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        node = [value, [item], {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            d = distance(value, current[0])
+            if d == 0:
+                current[1].append(item)
+                return
+            child = current[2].get(d)
+            if child is None:
+                current[2][d] = node
+                return
+            current = child
+
+    def search(self, value, radius):
+        """ Возвращает пары (расстояние, элемент) в пределах radius """
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = distance(value, node[0])
+            if d <= radius:
+                results.extend((d, item) for item in node[1])
+            # По неравенству треугольника ответ может быть
+            # только в ветвях с расстоянием от d - radius до d + radius
+            for child_distance, child in node[2].items():
+                if d - radius <= child_distance <= d + radius:
+                    stack.append(child)
+        return results
+
+
+class DuplicateIndex:
+    """ Индекс хешей изображений-оригиналов в памяти процесса.
+        Хеши хранятся в базе данных, индекс строится при первом
+        обращении и дополняется изображениями, хеш которых вычислен
+        позже. Порядок id для этого не годится: изображения
+        обрабатываются параллельно и становятся готовыми в любом порядке
+    """
+
+    def __init__(self):
+        self.tree = BKTree()
+        self.indexed = set()
+        self.refreshed = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """ Добавляет в дерево изображения, хеш которых вычислен
+            после предыдущего обращения
+        """
+        with self._lock:
+            started = timezone.now()
+            images = Image.objects.filter(status=Image.Status.READY,
+                                          phash__isnull=False,
+                                          duplicate_of__isnull=True)
+            if self.refreshed is not None:
+                images = images.filter(hashed__gte=self.refreshed - REFRESH_OVERLAP)
+            images = images.values_list('id', 'phash')
+            for image_id, phash in images.iterator(chunk_size=2000):
+                if image_id not in self.indexed:
+                    self.indexed.add(image_id)
+                    self.tree.add(phash, image_id)
+            self.refreshed = started
+
+    def find(self, phash, radius):
+        """ Возвращает id ближайших изображений по возрастанию расстояния """
+        self.refresh()
+        with self._lock:
+            matches = self.tree.search(phash, radius)
+        return [image_id for _, image_id in sorted(matches)]
+
+
+_index = DuplicateIndex()
+
+
+def find_duplicate(phash, exclude_id=None):
+    """ Возвращает уже сохраненное изображение, похожее на изображение
+        с данным хешем, или None
+    """
+    image_ids = [image_id for image_id in
+                 _index.find(phash, settings.IMAGE_DUPLICATE_DISTANCE)
+                 if image_id != exclude_id]
+    if not image_ids:
+        return None
+    # Индекс не знает об удаленных изображениях, поэтому проверяем их
+    images = Image.objects.filter(status=Image.Status.READY) \
+                          .exclude(image='').in_bulk(image_ids)
+    for image_id in image_ids:
+        if image_id in images:
+            return images[image_id]
+    return None
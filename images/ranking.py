@@ -0,0 +1,82 @@
+import logging
+import redis
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Image
+from config.redis_client import get_redis, breaker
+from .counters import RANKING_KEY, hourly_ranking_key, daily_ranking_key
+
+
+logger = logging.getLogger(__name__)
+
+
+# Доступные окна рейтинга. 'all' - за все время
+WINDOWS = ('hour', 'day', 'week', 'all')
+
+
+def window_keys(window, now):
+    """ Возвращает ключи рейтингов, из которых складывается окно """
+    if window == 'hour':
+        return [hourly_ranking_key(now)]
+    if window == 'day':
+        return [hourly_ranking_key(now - timedelta(hours=i)) for i in range(24)]
+    if window == 'week':
+        return [daily_ranking_key(now - timedelta(days=i)) for i in range(7)]
+    raise ValueError(f'Unknown ranking window: {window}')
+
+
+def top_image_ids(count, window='all'):
+    """ Возвращает id самых просматриваемых изображений. Из Redis
+        запрашиваются только первые count элементов рейтинга
+    """
+    r = get_redis()
+    key = RANKING_KEY
+    if window != 'all':
+        key = f'{RANKING_KEY}:window:{window}'
+        if not r.exists(key):
+            # Складываем рейтинги за часы или сутки окна и храним
+            # результат недолго, чтобы не пересчитывать его на каждый запрос
+            pipe = r.pipeline()
+            pipe.zunionstore(key, window_keys(window, timezone.now()))
+            pipe.expire(key, settings.IMAGE_RANKING_WINDOW_TTL)
+            pipe.execute()
+    return [int(image_id) for image_id in r.zrange(key, 0, count - 1, desc=True)]
+
+
+def top_images(count=None, window='all'):
+    """ Возвращает самые просматриваемые изображения в порядке рейтинга.
+        Результат кешируется на IMAGE_RANKING_CACHE_TTL секунд.
+        Если Redis недоступен, возвращает самые популярные по лайкам
+    """
+    if count is None:
+        count = settings.IMAGE_RANKING_SIZE
+    if not breaker.allow():
+        return fallback_top_images(count)
+    cache_key = f'image_ranking:top:{window}:{count}'
+    try:
+        images = cache.get(cache_key)
+        if images is None:
+            image_ids = top_image_ids(count, window)
+            images_by_id = Image.objects.in_bulk(image_ids)
+            images = [images_by_id[image_id] for image_id in image_ids
+                      if image_id in images_by_id]
+            cache.set(cache_key, images, settings.IMAGE_RANKING_CACHE_TTL)
+    except redis.RedisError as e:
+        breaker.failure()
+        logger.warning('Image ranking is unavailable: %s', e)
+        return fallback_top_images(count)
+    breaker.success()
+    return images
+
+
+def fallback_top_images(count):
+    """ Рейтинг по базе данных на время недоступности Redis.
+        Как и основной рейтинг, строится по просмотрам, но учитывает
+        только просмотры, уже перенесенные в базу данных
+    """
+    return list(Image.objects.filter(status=Image.Status.READY)
+                             .order_by('-total_views', '-id')[:count])
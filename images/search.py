@@ -0,0 +1,127 @@
+import re
+import functools
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .models import Image
+from .pagination import KeysetPage, encode_cursor, decode_cursor
+
+
+# Виртуальная таблица полнотекстового индекса SQLite FTS5.
+# Создается миграцией 0006_image_search
+FTS_TABLE = 'images_image_fts'
+
+WORD_RE = re.compile(r'\w+')
+
+
+def search_words(query):
+    """ Слова поискового запроса. Служебные символы отбрасываются,
+        поэтому пользователь не может нарушить синтаксис запроса FTS5
+    """
+    return WORD_RE.findall(query.lower())[:settings.IMAGE_SEARCH_MAX_WORDS]
+
+
+class SearchBackend:
+    """ Базовый класс поискового бэкенда изображений """
+
+    def index(self, image):
+        """ Добавляет или обновляет изображение в индексе """
+
+    def remove(self, image_id):
+        """ Удаляет изображение из индекса """
+
+    def rebuild(self):
+        """ Строит индекс заново. Возвращает число изображений """
+        return 0
+
+    def search_ids(self, words, offset, limit):
+        """ Возвращает id найденных изображений по убыванию релевантности """
+        raise NotImplementedError
+
+
+class SimpleSearchBackend(SearchBackend):
+    """ Поиск без индекса, для баз данных без FTS5. Подходит только
+        для небольшого числа изображений
+    """
+
+    def search_ids(self, words, offset, limit):
+        images = Image.objects.filter(status=Image.Status.READY)
+        for word in words:
+            images = images.filter(title__icontains=word) | \
+                     images.filter(description__icontains=word)
+        return list(images.order_by('-total_likes', '-id')
+                          .values_list('id', flat=True)[offset:offset + limit])
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """ Поиск по индексу SQLite FTS5 с ранжированием bm25.
+        В индекс попадают только загруженные изображения, rowid
+        строки индекса совпадает с id изображения
+    """
+
+    def index(self, image):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [image.id])
+            if image.status == Image.Status.READY:
+                cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+                               f'VALUES (%s, %s, %s)',
+                               [image.id, image.title, image.description])
+
+    def remove(self, image_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [image_id])
+
+    def rebuild(self):
+        table = Image._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+                           f'SELECT id, title, description FROM {table} '
+                           f'WHERE status = %s', [Image.Status.READY])
+            # Сливаем сегменты индекса в один для быстрого поиска
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+            return cursor.fetchone()[0]
+
+    def search_ids(self, words, offset, limit):
+        # Каждое слово ищется как префикс, все слова должны встретиться.
+        # Совпадения в заголовке весят больше, чем в описании
+        match = ' '.join(f'"{word}"*' for word in words)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {FTS_TABLE} '
+                           f'WHERE {FTS_TABLE} MATCH %s '
+                           f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0), rowid '
+                           f'LIMIT %s OFFSET %s',
+                           [match, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+@functools.cache
+def get_backend():
+    """ Возвращает поисковый бэкенд, заданный настройкой IMAGE_SEARCH_BACKEND """
+    return import_string(settings.IMAGE_SEARCH_BACKEND)()
+
+
+def search_images(query, cursor=None, per_page=None):
+    """ Возвращает страницу найденных изображений по убыванию
+        релевантности. Курсор хранит смещение следующей страницы,
+        число страниц ограничено настройкой IMAGE_SEARCH_MAX_RESULTS
+    """
+    per_page = per_page or settings.IMAGE_LIST_PAGE_SIZE
+    words = search_words(query)
+    values = decode_cursor(cursor, 1)
+    offset = int(values[0]) if values and str(values[0]).isdigit() else 0
+    limit = min(per_page + 1, settings.IMAGE_SEARCH_MAX_RESULTS - offset)
+    if not words or limit <= 0:
+        return KeysetPage([], None)
+    image_ids = get_backend().search_ids(words, offset, limit)
+    next_cursor = None
+    if len(image_ids) > per_page:
+        image_ids = image_ids[:per_page]
+        next_cursor = encode_cursor([offset + per_page])
+    images = Image.objects.filter(status=Image.Status.READY).in_bulk(image_ids)
+    # Изображения в порядке релевантности
+    return KeysetPage([images[image_id] for image_id in image_ids
+                       if image_id in images], next_cursor)
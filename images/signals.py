@@ -1,10 +1,109 @@
-from django.db.models.signals import m2m_changed
+from collections import Counter
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.dispatch import receiver
+from easy_thumbnails.signals import saved_file
 
 from .models import Image
+from .thumbnails import enqueue_thumbnails
+from .cache import invalidate_image, invalidate_list
+from .search import get_backend
+from .blobs import release
+from account.counters import update_counters
+
+
+def liked_image_ids(sender, instance, reverse, pk_set=None):
+    """ Возвращает id изображений по каждому существующему лайку экземпляра,
+        участвующего в изменении. При reverse=True экземпляр - пользователь
+    """
+    if reverse:
+        likes = sender.objects.filter(user_id=instance.pk)
+        if pk_set is not None:
+            likes = likes.filter(image_id__in=pk_set)
+    else:
+        likes = sender.objects.filter(image_id=instance.pk)
+        if pk_set is not None:
+            likes = likes.filter(user_id__in=pk_set)
+    return list(likes.values_list('image_id', flat=True))
 
 
 @receiver(m2m_changed, sender=Image.users_like.through)
-def user_like_changed(sender, instance, **kwargs):
-    instance.total_likes = instance.users_like.count()
-    instance.save()
+def user_like_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Поддерживает счетчик total_likes атомарными обновлениями
+        вместо пересчета лайков и сохранения всей строки
+    """
+    if action in ('pre_remove', 'pre_clear'):
+        # В pk_set при удалении могут быть и несуществующие связи,
+        # а при очистке он не передается вовсе, поэтому запоминаем
+        # изображения, у которых лайк действительно будет снят
+        instance._unliked_image_ids = liked_image_ids(sender, instance, reverse,
+                                                  pk_set)
+        return
+    if action == 'post_add':
+        step = 1
+        if reverse:
+            image_ids = list(pk_set)
+        else:
+            image_ids = [instance.pk] * len(pk_set)
+    elif action in ('post_remove', 'post_clear'):
+        step = -1
+        image_ids = getattr(instance, '_unliked_image_ids', [])
+        instance._unliked_image_ids = []
+    else:
+        return
+    if not image_ids:
+        return
+    for image_id in set(image_ids):
+        invalidate_image(image_id)
+    if reverse:
+        Image.objects.filter(id__in=image_ids) \
+                     .update(total_likes=Greatest(F('total_likes') + step, 0))
+        owners = Counter(Image.objects.filter(id__in=image_ids)
+                                      .values_list('user_id', flat=True))
+    else:
+        # Все связи относятся к одному изображению
+        delta = step * len(image_ids)
+        Image.objects.filter(id=instance.pk) \
+                     .update(total_likes=Greatest(F('total_likes') + delta, 0))
+        owners = {instance.user_id: len(image_ids)}
+    # Лайки, полученные авторами изображений
+    for user_id, total in owners.items():
+        update_counters(user_id, likes_received=step * total)
+
+
+@receiver(saved_file)
+def file_saved(sender, fieldfile, **kwargs):
+    """ Ставит генерацию миниатюр нового файла в очередь """
+    enqueue_thumbnails(fieldfile)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def image_changed(sender, instance, **kwargs):
+    """ Сбрасывает закешированные карточку и страницы списка """
+    invalidate_image(instance.id)
+    invalidate_list()
+
+
+@receiver(post_save, sender=Image)
+def image_saved_search(sender, instance, update_fields=None, **kwargs):
+    """ Обновляет изображение в поисковом индексе в той же транзакции """
+    if update_fields and not {'title', 'description',
+                              'status'} & set(update_fields):
+        return
+    get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Image)
+def image_deleted_search(sender, instance, **kwargs):
+    """ Удаляет изображение из поискового индекса """
+    get_backend().remove(instance.id)
+
+
+@receiver(post_delete, sender=Image)
+def image_deleted_blob(sender, instance, **kwargs):
+    """ Освобождает файл удаленного изображения в общем хранилище """
+    if instance.blob_id:
+        release(instance.blob_id)
@@ -0,0 +1,17 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from images.cache import render_cards
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_cards(images):
+    """ Выводит закешированные карточки изображений
+
+        Пример использования:
+            {% image_cards images %}
+    """
+    return mark_safe(''.join(render_cards(images)))
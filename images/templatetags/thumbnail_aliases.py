@@ -0,0 +1,20 @@
+from django import template
+
+from images.thumbnails import thumbnail_url
+
+
+register = template.Library()
+
+
+@register.filter
+def alias_url(fieldfile, alias):
+    """ Выводит url-адрес заранее сгенерированной миниатюры
+
+        Пример использования:
+            <img src="{{ image.image|alias_url:'card' }}">
+    """
+    try:
+        return thumbnail_url(fieldfile, alias)
+    except KeyError:
+        # Псевдоним не описан в THUMBNAIL_ALIASES
+        return ''
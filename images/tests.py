@@ -1,3 +1,427 @@
-from django.test import TestCase
+from unittest import mock
+from datetime import timedelta
 
-# Create your tests here.
+import redis
+import fakeredis
+from PIL import Image as PILImage
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Blob, Image
+from .ingest import claim, process_image, requeue_stale
+from .downloads import DownloadError, probe
+from .phash import DuplicateIndex
+from .pagination import KeysetPage, encode_cursor, keyset_page, normalize_cursor
+from .cache import cached_list_page
+from .thumbnails import _generate_pending
+from .ranking import top_images
+from .search import search_images, search_words
+from . import counters
+from .counters import flush_views, record_view, views_key
+from config.redis_client import get_redis, set_redis, breaker
+
+
+class ImageTestCase(TestCase):
+    """ Тесты с пустыми кешем и Redis и пользователем, вошедшим в систему """
+
+    def setUp(self):
+        cache.clear()
+        get_redis().flushall()
+        breaker.success()
+        self.addCleanup(breaker.success)
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        self.client.force_login(self.user)
+
+
+class ImageCacheTests(ImageTestCase):
+    """ Кеш карточек и страниц списка изображений """
+
+    def test_changes_survive_redis_errors(self):
+        """ Ошибка Redis при сбросе версий не отменяет изменение данных """
+        with mock.patch('images.cache.cache.set',
+                        side_effect=redis.ConnectionError):
+            image = Image.objects.create(user=self.user,
+                                         title='Sunset',
+                                         url='http://example.com/sunset.jpg')
+            image.users_like.add(self.user)
+        image.refresh_from_db()
+        self.assertEqual(image.total_likes, 1)
+
+
+    @mock.patch('images.thumbnails.generate_thumbnails')
+    def test_thumbnails_invalidate_list_pages(self, generate_thumbnails):
+        """ Страница списка, закешированная до появления миниатюр,
+            не отдается после их генерации
+        """
+        image = Image.objects.create(user=self.user, title='Sunset',
+                                     url='http://example.com/sunset.jpg',
+                                     image='images/sunset.jpg')
+        get_page = mock.Mock(return_value=KeysetPage([image], None))
+        cached_list_page('', get_page)
+        cached_list_page('', get_page)
+        self.assertEqual(get_page.call_count, 1)
+        with mock.patch('images.thumbnails.close_old_connections'):
+            _generate_pending(image.image)
+        cached_list_page('', get_page)
+        self.assertEqual(get_page.call_count, 2)
+
+
+class ImageCreateTests(ImageTestCase):
+
+    @mock.patch('images.forms.probe')
+    def test_bookmarklet_get_does_not_probe(self, probe):
+        """ Открытие формы букмарклетом не обращается к серверу изображения """
+        response = self.client.get(reverse('images:create'),
+                                   {'title': 'Sunset',
+                                    'url': 'http://example.com/sunset.jpg'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'http://example.com/sunset.jpg')
+        probe.assert_not_called()
+
+    @mock.patch('images.forms.probe', return_value=('JPEG', 800, 600))
+    def test_post_probes_url(self, probe):
+        with mock.patch('images.views.enqueue'):
+            response = self.client.post(reverse('images:create'),
+                                        {'title': 'Sunset',
+                                         'url': 'http://example.com/sunset.jpg'})
+        self.assertEqual(response.status_code, 302)
+        probe.assert_called_once_with('http://example.com/sunset.jpg')
+        self.assertEqual(Image.objects.get().status, Image.Status.PENDING)
+
+
+class ProbeTests(ImageTestCase):
+
+    def session(self):
+        """ HTTP-сессия, отдающая начало файла изображения """
+        session = mock.MagicMock()
+        response = session.get.return_value.__enter__.return_value
+        response.iter_content.return_value = [b'\x89PNG\r\n\x1a\n' + b'\0' * 32]
+        return session
+
+    def test_bad_image_header_is_a_form_error(self):
+        """ Ошибки Pillow при разборе заголовка не приводят к ошибке 500 """
+        for error in (PILImage.DecompressionBombError('bomb'), OSError('broken'),
+                      SyntaxError('not a PNG'), ValueError('bad mode')):
+            with mock.patch('images.downloads.get_session', self.session), \
+                    mock.patch('images.downloads.ImageFile.Parser') as parser:
+                parser.return_value.feed.side_effect = error
+                with self.assertRaises(DownloadError):
+                    probe('http://example.com/bomb.png')
+                response = self.client.post(reverse('images:create'),
+                                            {'title': 'Bomb',
+                                             'url': 'http://example.com/bomb.png'})
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'could not be loaded as an image')
+        self.assertFalse(Image.objects.exists())
+
+
+class RankingTests(ImageTestCase):
+
+    def test_ranking_without_redis(self):
+        """ Без Redis рейтинг строится по просмотрам из базы данных """
+        images = [Image.objects.create(user=self.user, title=f'Image {i}',
+                                       url=f'http://example.com/{i}.jpg',
+                                       total_views=views, total_likes=likes)
+                  for i, (views, likes) in enumerate([(1, 9), (5, 0), (3, 1)])]
+        with mock.patch('images.ranking.cache.get',
+                        side_effect=redis.ConnectionError):
+            self.assertEqual(top_images(2), [images[1], images[2]])
+            response = self.client.get(reverse('images:ranking'))
+        self.assertEqual(response.status_code, 200)
+
+
+class KeysetPaginationTests(ImageTestCase):
+    ordering = ('-created', '-id')
+
+    def setUp(self):
+        super().setUp()
+        self.images = [Image.objects.create(user=self.user,
+                                            title=f'Image {i}',
+                                            url=f'http://example.com/{i}.jpg')
+                       for i in range(5)]
+
+    def test_pages_cover_all_images(self):
+        ids = []
+        cursor = None
+        while True:
+            page = keyset_page(Image.objects.all(), cursor, 2, self.ordering)
+            ids += [image.id for image in page]
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(ids, [image.id for image in reversed(self.images)])
+
+    def test_tampered_cursor_returns_first_page(self):
+        """ Курсор с неверными значениями полей не ломает запрос """
+        for values in (['abc', '1'], ['2026-01-01', 'x'],
+                       ['2026-01-01', '99999999999999999999999'],
+                       [None, None], [[1], {'a': 1}]):
+            cursor = encode_cursor(values)
+            self.assertEqual(normalize_cursor(Image, cursor, self.ordering), '')
+            page = keyset_page(Image.objects.all(), cursor, 2, self.ordering)
+            self.assertEqual(page.object_list, self.images[:-3:-1])
+            for url in (reverse('images:list'), reverse('images:feed'),
+                        reverse('images:likers', args=[self.images[0].id]),
+                        reverse('user_list'),
+                        reverse('user_detail', args=[self.user.username])):
+                response = self.client.get(url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 200, url)
+
+    def test_cursor_is_normalized(self):
+        """ Разные записи одного курсора дают один ключ кеша """
+        image = self.images[2]
+        cursor = encode_cursor([image.created, image.id])
+        padded = encode_cursor([image.created, f'000{image.id}'])
+        self.assertEqual(normalize_cursor(Image, padded, self.ordering), cursor)
+
+
+class DuplicateIndexTests(ImageTestCase):
+
+    def create_image(self, **kwargs):
+        return Image.objects.create(user=self.user, title='Sunset',
+                                    url='http://example.com/sunset.jpg', **kwargs)
+
+    def test_images_ready_out_of_order_are_indexed(self):
+        """ Изображение, ставшее готовым после изображения с большим id,
+            тоже попадает в индекс
+        """
+        index = DuplicateIndex()
+        first = self.create_image(status=Image.Status.PROCESSING)
+        self.create_image(phash=0, hashed=timezone.now())
+        self.assertEqual(len(index.find(0, 0)), 1)
+        Image.objects.filter(id=first.id).update(status=Image.Status.READY,
+                                                 phash=-1,
+                                                 hashed=timezone.now())
+        self.assertEqual(index.find(-1, 0), [first.id])
+        self.assertEqual(index.tree.size, 2)
+
+
+class IngestTests(ImageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.image = Image.objects.create(user=self.user, title='Sunset',
+                                          url='http://example.com/sunset.jpg',
+                                          status=Image.Status.PENDING)
+        self.blob = Blob.objects.create(sha256='0' * 64, file='blobs/sunset.jpg',
+                                        size=1)
+
+    def fake_download(self, image):
+        image.blob = self.blob
+        image.image.name = self.blob.file.name
+        image.phash = 0
+        return False
+
+    def test_only_stale_images_are_requeued(self):
+        """ Изображения, которые еще обрабатываются, не возвращаются в очередь """
+        self.assertIsNotNone(claim(self.image.id))
+        self.assertEqual(requeue_stale(), 0)
+        Image.objects.filter(id=self.image.id) \
+                     .update(processing_started=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(), 1)
+        self.assertIsNotNone(claim(self.image.id))
+
+    def test_requeued_image_is_saved_once(self):
+        """ Если изображение вернули в очередь во время обработки, результат
+            сохраняет только последний захвативший его поток
+        """
+        results = []
+        calls = []
+
+        def download(image):
+            calls.append(image.id)
+            if len(calls) == 1:
+                # Пока первый поток скачивает файл, изображение
+                # возвращается в очередь и обрабатывается заново
+                Image.objects.filter(id=image.id).update(status=Image.Status.PENDING)
+                results.append(process_image(image.id))
+            return self.fake_download(image)
+
+        with mock.patch('images.ingest.download_image', download):
+            results.append(process_image(self.image.id))
+        self.assertEqual(results, [True, False])
+        self.blob.refresh_from_db()
+        self.assertEqual(self.blob.refcount, 1)
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.status, Image.Status.READY)
+
+
+class ViewCounterTests(ImageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.image = Image.objects.create(user=self.user, title='Sunset',
+                                          url='http://example.com/sunset.jpg')
+
+    def test_views_are_flushed_to_database(self):
+        for _ in range(3):
+            record_view(self.image)
+        self.assertEqual(flush_views(), 1)
+        self.assertEqual(flush_views(), 0)
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.total_views, 3)
+
+    def test_interrupted_flush_is_not_applied_twice(self):
+        """ Если процесс остановился после записи просмотров в базу
+            данных, но до удаления пачки из Redis, повторный перенос
+            не прибавляет их еще раз
+        """
+        for _ in range(3):
+            record_view(self.image)
+        client = get_redis()
+        with mock.patch.object(client, 'delete', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                flush_views()
+        self.assertEqual(flush_views(), 0)
+        record_view(self.image)
+        self.assertEqual(flush_views(), 1)
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.total_views, 4)
+
+
+def failing_redis():
+    """ Клиент Redis, все обращения к которому завершаются ошибкой соединения """
+    server = fakeredis.FakeServer()
+    server.connected = False
+    return fakeredis.FakeRedis(server=server)
+
+
+class DegradedViewCounterTests(ImageTestCase):
+    """ Учет просмотров, пока Redis недоступен """
+
+    def setUp(self):
+        super().setUp()
+        counters._local_views.clear()
+        counters._last_views.clear()
+        self.addCleanup(counters._local_views.clear)
+        self.image = Image.objects.create(user=self.user, title='Sunset',
+                                          url='http://example.com/sunset.jpg',
+                                          total_views=10)
+
+    def break_redis(self):
+        previous = set_redis(failing_redis())
+        self.addCleanup(set_redis, previous)
+        return previous
+
+    def test_views_accumulate_locally(self):
+        working = self.break_redis()
+        failures = settings.REDIS_BREAKER_FAILURES
+        totals = [record_view(self.image) for _ in range(failures + 2)]
+        self.assertTrue(breaker.is_open)
+        # Приблизительное число просмотров: сохраненные в базе данных
+        # вместе с накопленными в процессе
+        self.assertEqual(totals, list(range(11, 11 + failures + 2)))
+        self.assertEqual(counters._local_views[self.image.id], failures + 2)
+        self.assertFalse(working.exists(views_key(self.image.id)))
+
+    def test_local_views_are_written_back(self):
+        """ Когда Redis снова доступен, накопленные просмотры переносятся
+            в него, а затем в базу данных
+        """
+        working = self.break_redis()
+        for _ in range(settings.REDIS_BREAKER_FAILURES + 2):
+            record_view(self.image)
+        set_redis(working)
+        # Истекло время, на которое размыкатель прекратил обращения
+        breaker.opened_at -= settings.REDIS_BREAKER_RESET_SECONDS
+        record_view(self.image)
+        self.assertFalse(breaker.is_open)
+        self.assertFalse(counters._local_views)
+        local = settings.REDIS_BREAKER_FAILURES + 2
+        self.assertEqual(int(working.get(views_key(self.image.id))), 10 + local + 1)
+        flush_views()
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.total_views, 10 + local + 1)
+
+
+class SearchTests(ImageTestCase):
+    """ Полнотекстовый поиск изображений """
+
+    def create_image(self, title, description='', **kwargs):
+        return Image.objects.create(user=self.user, title=title,
+                                    description=description,
+                                    url='http://example.com/image.jpg', **kwargs)
+
+    def found(self, query):
+        return [image.id for image in search_images(query, per_page=100)]
+
+    def test_index_follows_saves_and_deletes(self):
+        image = self.create_image('Red sunset')
+        self.assertEqual(self.found('sunset'), [image.id])
+        image.title = 'Blue lagoon'
+        image.save()
+        self.assertEqual(self.found('sunset'), [])
+        self.assertEqual(self.found('lagoon'), [image.id])
+        image.delete()
+        self.assertEqual(self.found('lagoon'), [])
+
+    def test_unrelated_update_fields_skip_index(self):
+        image = self.create_image('Red sunset')
+        image.title = 'Blue lagoon'
+        image.total_views = 5
+        with self.assertNumQueries(1):
+            image.save(update_fields=['total_views'])
+        self.assertEqual(self.found('sunset'), [image.id])
+        image.save(update_fields=['title'])
+        self.assertEqual(self.found('lagoon'), [image.id])
+
+    def test_only_ready_images_are_indexed(self):
+        image = self.create_image('Red sunset', status=Image.Status.PENDING)
+        self.assertEqual(self.found('sunset'), [])
+        image.status = Image.Status.READY
+        image.save(update_fields=['status'])
+        self.assertEqual(self.found('sunset'), [image.id])
+        image.status = Image.Status.FAILED
+        image.save(update_fields=['status'])
+        self.assertEqual(self.found('sunset'), [])
+
+    def test_title_ranks_above_description(self):
+        in_description = self.create_image('Evening', 'A sunset over the sea')
+        in_title = self.create_image('Sunset', 'Evening over the sea')
+        self.assertEqual(self.found('sunset'), [in_title.id, in_description.id])
+
+    def test_words_are_prefixes_and_all_required(self):
+        image = self.create_image('Red sunset')
+        self.create_image('Red car')
+        self.assertEqual(self.found('sun re'), [image.id])
+
+    def test_query_syntax_is_ignored(self):
+        self.assertEqual(search_words('"Sunset" OR sea* -NEAR(a b)'),
+                         ['sunset', 'or', 'sea', 'near', 'a', 'b'])
+        image = self.create_image('Sunset near the sea')
+        self.assertEqual(self.found('sunset" OR "x'), [])
+        self.assertEqual(self.found('"sunset* (sea)'), [image.id])
+        self.assertEqual(self.found('*"()'), [])
+
+    @override_settings(IMAGE_SEARCH_MAX_RESULTS=5)
+    def test_results_are_limited(self):
+        for i in range(8):
+            self.create_image(f'Sunset {i}')
+        page = search_images('sunset', per_page=3)
+        self.assertEqual(len(page.object_list), 3)
+        page = search_images('sunset', cursor=page.next_cursor, per_page=3)
+        self.assertEqual(len(page.object_list), 2)
+        self.assertIsNone(page.next_cursor)
+
+    def test_search_feed(self):
+        images = [self.create_image(f'Sunset {i}')
+                  for i in range(settings.IMAGE_LIST_PAGE_SIZE + 1)]
+        self.create_image('Lagoon')
+        url = reverse('images:search_feed')
+        data = self.client.get(url, {'q': 'sunset'}).json()
+        self.assertEqual(len(data['images']), settings.IMAGE_LIST_PAGE_SIZE)
+        self.assertEqual(data['images'][0]['title'], 'Sunset 0')
+        self.assertEqual(data['images'][0]['url'], images[0].get_absolute_url())
+        data = self.client.get(url, {'q': 'sunset',
+                                     'cursor': data['next_cursor']}).json()
+        self.assertEqual([image['id'] for image in data['images']], [images[-1].id])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_search_page(self):
+        self.create_image('Red sunset')
+        response = self.client.get(reverse('images:search'), {'q': 'sunset'})
+        self.assertContains(response, 'Red sunset')
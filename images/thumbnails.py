@@ -0,0 +1,66 @@
+import logging
+import threading
+
+from django.db import transaction, close_old_connections
+from easy_thumbnails.files import get_thumbnailer, generate_all_aliases
+
+from .models import Image
+from .ingest import get_executor
+from .cache import invalidate_image, invalidate_list
+
+
+logger = logging.getLogger(__name__)
+
+# Файлы, генерация миниатюр которых уже стоит в очереди
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def generate_thumbnails(fieldfile):
+    """ Генерирует миниатюры файла для всех псевдонимов его поля """
+    generate_all_aliases(fieldfile, include_global=False)
+
+
+def _generate_pending(fieldfile):
+    try:
+        generate_thumbnails(fieldfile)
+        if isinstance(fieldfile.instance, Image):
+            # В закешированных карточке и страницах списка, в которые
+            # она входит, мог остаться url-адрес исходного файла
+            invalidate_image(fieldfile.instance.id)
+            invalidate_list()
+    except Exception:
+        logger.exception('Failed to generate thumbnails for %s', fieldfile.name)
+    finally:
+        with _pending_lock:
+            _pending.discard(fieldfile.name)
+        close_old_connections()
+
+
+def enqueue_thumbnails(fieldfile):
+    """ Ставит генерацию миниатюр файла в очередь фонового пула """
+    def submit():
+        with _pending_lock:
+            if fieldfile.name in _pending:
+                return
+            _pending.add(fieldfile.name)
+        get_executor().submit(_generate_pending, fieldfile)
+
+    transaction.on_commit(submit)
+
+
+def thumbnail_url(fieldfile, alias):
+    """ Возвращает url-адрес заранее сгенерированной миниатюры.
+        Если миниатюры еще нет, то ставит ее генерацию в очередь
+        и возвращает url-адрес исходного файла
+    """
+    if not fieldfile:
+        return ''
+    thumbnailer = get_thumbnailer(fieldfile)
+    # Запрещаем генерировать миниатюру во время обработки запроса
+    thumbnailer.generate = False
+    thumbnail = thumbnailer[alias]
+    if thumbnail is None:
+        enqueue_thumbnails(fieldfile)
+        return fieldfile.url
+    return thumbnail.url
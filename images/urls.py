@@ -9,7 +9,12 @@ urlpatterns = [
     path('create/', view=views.image_create, name='create'),
     path('detail/<int:id>/<slug:slug>/', view=views.image_deteil, name='detail'),
     path('like/', view=views.image_like, name='like'),
+    path('likers/<int:id>/', view=views.image_likers, name='likers'),
+    path('status/<int:id>/', view=views.image_status, name='status'),
     path('', view=views.image_list, name='list'),
+    path('feed/', view=views.image_feed, name='feed'),
     path('ranking/', view=views.image_ranking, name='ranking'),
+    path('search/', view=views.image_search, name='search'),
+    path('search/feed/', view=views.image_search_feed, name='search_feed'),
 ]
 
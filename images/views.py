@@ -1,23 +1,23 @@
-import redis
-
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.http import require_POST
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.conf import settings
+from django.db import transaction
 
 from .forms import ImageCreateForm
 from .models import Image
+from .ingest import enqueue
+from .counters import record_view
+from .ranking import WINDOWS, top_images
+from .pagination import keyset_page, normalize_cursor
+from .thumbnails import thumbnail_url
+from .cache import cached_list_page, render_cards
+from .search import search_images
 from actions.utils import create_action
-
-
-r = redis.Redis(host=settings.REDIS_HOST,
-                port=settings.REDIS_PORT,
-                db=settings.REDIS_DB,
-                username=settings.REDIS_USER,
-                password=settings.REDIS_PASSWORD)
+from account.counters import update_counters
+from config.profiling import query_budget
 
 
 @login_required
@@ -32,7 +32,11 @@ def image_create(request):
             new_image = form.save(commit=False)
             # назначаем текущего пользователя элементу
             new_image.user = request.user
-            new_image.save()
+            with transaction.atomic():
+                new_image.save()
+                update_counters(request.user.id, images=1)
+            # файл изображения скачивается в фоне
+            enqueue(new_image)
             create_action(request.user, 'bookmarked image', new_image)
             messages.success(request=request, message='Image added successfully')
             # перенаправляем к представлению детальной информации
@@ -40,8 +44,9 @@ def image_create(request):
             return redirect(new_image.get_absolute_url())
     else:
         # скомпановываем форму с данными, представленным букмарклетом
-        # методом GET
-        form = ImageCreateForm(data=request.GET)
+        # методом GET. Форма не проверяется: проверка url-адреса
+        # обращается к его серверу, и делать это стоит только при отправке
+        form = ImageCreateForm(initial=request.GET.dict())
 
     context = {'section': 'images', 'form': form}
     template = 'images/image/create.html'
@@ -49,22 +54,69 @@ def image_create(request):
     return render(request=request, template_name=template, context=context)
 
 
+@query_budget(6)
 def image_deteil(request, id, slug):
     """ Представление для вывода изображения на страницу """
-    image = get_object_or_404(Image, id=id, slug=slug)
-    # увеличиваем общее число просмотров
-    total_views = r.incr(f'image:{image.id}:views')
-    # увеличиваем рейтинг изображения на 1
-    r.zincrby('image_ranking', 1, image.id)
+    image = get_object_or_404(Image.objects.select_related('duplicate_of'),
+                              id=id, slug=slug)
+    # увеличиваем общее число просмотров и рейтинг изображения
+    # за один запрос к Redis. Если Redis недоступен, просмотр
+    # учитывается позже, а число просмотров будет приблизительным
+    total_views = record_view(image)
+    # проверяем лайк текущего пользователя по индексу,
+    # не загружая всех поклонников изображения
+    liked = request.user.is_authenticated and \
+        image.users_like.filter(id=request.user.id).exists()
+    # несколько последних поклонников вместе с профилями
+    likes = Image.users_like.through.objects.filter(image=image) \
+                                            .select_related('user__profile') \
+                                            .order_by('-id')
+    likers = [like.user for like in likes[:settings.IMAGE_LIKERS_PREVIEW_SIZE]]
     context = {
         'section': 'images', 
         'image': image,
-        'total_views': total_views
+        'total_views': total_views,
+        'liked': liked,
+        'likers': likers,
     }
     template = 'images/image/detail.html'
     return render(request=request, template_name=template, context=context)
 
 
+def image_likers(request, id):
+    """ Представление постраничного списка поклонников изображения """
+    image = get_object_or_404(Image, id=id)
+    likes = keyset_page(Image.users_like.through.objects.filter(image=image)
+                                                       .select_related('user__profile'),
+                        cursor=request.GET.get('cursor'),
+                        per_page=settings.IMAGE_LIKERS_PAGE_SIZE,
+                        ordering=('-id',))
+    users = []
+    for like in likes:
+        user = like.user
+        profile = getattr(user, 'profile', None)
+        users.append({
+            'username': user.username,
+            'first_name': user.first_name,
+            'url': user.get_absolute_url(),
+            'photo': profile.photo.url if profile and profile.photo else '',
+        })
+    return JsonResponse({'users': users, 'next_cursor': likes.next_cursor})
+
+
+@login_required
+def image_status(request, id):
+    """ Представление состояния фоновой загрузки изображения """
+    image = get_object_or_404(Image, id=id)
+    data = {'id': image.id, 'status': image.status}
+    if image.status == Image.Status.READY:
+        data['url'] = image.image.url
+        if image.duplicate_of_id:
+            data['duplicate_of'] = image.duplicate_of.get_absolute_url()
+    return JsonResponse(data)
+
+
+@query_budget(12)
 @login_required # не дает пользователям, не вошедшим в систему, обращаться к этому представлению
 @require_POST # разрешает запросы только методом POST
 def image_like(request):
@@ -85,43 +137,116 @@ def image_like(request):
     return JsonResponse({'status': 'error'})
 
 
+@query_budget(6)
 @login_required
 def image_list(request):
-    images = Image.objects.all()
-    paginator = Paginator(images, 8)
-    page = request.GET.get('page')
+    ordering = ('-created', '-id')
+    cursor = normalize_cursor(Image, request.GET.get('cursor'), ordering)
+    # Постраничная навигация по ключу (created, id) вместо номера страницы.
+    # Готовые страницы списка берутся из кеша
+    images_html, next_cursor = cached_list_page(
+        page_key=cursor,
+        get_page=lambda: keyset_page(Image.objects.filter(status=Image.Status.READY),
+                                     cursor=cursor,
+                                     per_page=settings.IMAGE_LIST_PAGE_SIZE,
+                                     ordering=ordering))
     images_only = request.GET.get('images_only')
-    try:
-        images = paginator.page(page)
-    except PageNotAnInteger:
-        # Если страница не является целым числом,
-        # то доставить первую страницу
-        images = paginator.page(1)
-    except EmptyPage:
-        if images_only:
-            # Если AJAX-запрос и страница вне диапазона,
+    if images_only:
+        if not images_html.strip():
+            # Если AJAX-запрос и изображений больше нет,
             # то вернуть пустую страницу
             return HttpResponse('')
-        # Если страница вне диапазона, то вкреуть последнюю
-        # страницу результатов
-        images = paginator.page(paginator.num_pages)
-    if images_only:
-        context = {'section': 'images', 'images': images}
-        template = 'images/image/list_images.html'
-        return render(request=request, template_name=template, context=context)
-    context = {'section': 'images', 'images': images}
+        response = HttpResponse(images_html)
+        if next_cursor:
+            # Курсор следующей страницы для бесконечной прокрутки
+            response['X-Next-Cursor'] = next_cursor
+        return response
+    context = {
+        'section': 'images',
+        'images_html': images_html,
+        'next_cursor': next_cursor,
+    }
     template = 'images/image/list.html'
     return render(request=request, template_name=template, context=context)
 
 
+@login_required
+def image_feed(request):
+    """ Представление ленты изображений в формате JSON """
+    images = keyset_page(Image.objects.filter(status=Image.Status.READY),
+                         cursor=request.GET.get('cursor'),
+                         per_page=settings.IMAGE_LIST_PAGE_SIZE,
+                         ordering=('-created', '-id'))
+    data = {
+        'images': [
+            {
+                'id': image.id,
+                'title': image.title,
+                'url': image.get_absolute_url(),
+                'thumbnail': thumbnail_url(image.image, 'card'),
+            }
+            for image in images
+        ],
+        'next_cursor': images.next_cursor,
+    }
+    return JsonResponse(data)
+
+
+@login_required
+def image_search(request):
+    """ Представление полнотекстового поиска изображений """
+    query = request.GET.get('q', '')
+    images = search_images(query, cursor=request.GET.get('cursor'))
+    if request.GET.get('images_only'):
+        if not images.object_list:
+            return HttpResponse('')
+        response = HttpResponse(''.join(render_cards(images)))
+        if images.next_cursor:
+            response['X-Next-Cursor'] = images.next_cursor
+        return response
+    context = {
+        'section': 'images',
+        'query': query,
+        'images': images,
+    }
+    template = 'images/image/search.html'
+    return render(request=request, template_name=template, context=context)
+
+
+@login_required
+def image_search_feed(request):
+    """ Результаты поиска изображений в формате JSON """
+    images = search_images(request.GET.get('q', ''),
+                           cursor=request.GET.get('cursor'))
+    data = {
+        'images': [
+            {
+                'id': image.id,
+                'title': image.title,
+                'url': image.get_absolute_url(),
+                'thumbnail': thumbnail_url(image.image, 'card'),
+            }
+            for image in images
+        ],
+        'next_cursor': images.next_cursor,
+    }
+    return JsonResponse(data)
+
+
+@query_budget(4)
 @login_required
 def image_ranking(request):
-    # получаем словарь рейтинга изображений
-    image_ranking = r.zrange('image_ranking', 0, -1, desc=True)[:10]
-    image_ranking_ids = [int(idx) for idx in image_ranking]
+    # окно рейтинга: за час, сутки, неделю или за все время
+    window = request.GET.get('window')
+    if window not in WINDOWS:
+        window = 'all'
     # получаем наиболее просматриваемые изображения
-    most_viewed = list(Image.objects.filter(id__in=image_ranking_ids))
-    most_viewed.sort(key=lambda x: image_ranking_ids.index(x.id))
-    context = {'section': 'image', 'most_viewed': most_viewed}
+    most_viewed = top_images(window=window)
+    context = {
+        'section': 'image',
+        'most_viewed': most_viewed,
+        'window': window,
+        'windows': WINDOWS,
+    }
     template = 'images/image/rating.html'
     return render(request=request, template_name=template, context=context)